@@ -1,14 +1,16 @@
 import streamlit as st
-import json
-import tempfile
-import os
+import orjson
 import sys
 import pandas as pd
 from utils.ocr import DocumentIntelligenceExtractor
 from utils.openai_extractor import OpenAIExtractor
 from utils.validation import ExtractionValidator
+from config import AZURE_OPENAI_DEPLOYMENT_NAME
 import logging
 import datetime
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuration de la page
 st.set_page_config(
@@ -34,12 +36,47 @@ This application automatically extracts information from National Insurance Inst
 3. View and edit the extracted results if needed
 """)
 
-# Initialisation des extracteurs
+# Initialisation des extracteurs : une ressource en cache par extracteur, pour que chacun
+# garde ses propres clients et connexions si un autre doit être recréé
 @st.cache_resource
-def get_extractors():
-    return DocumentIntelligenceExtractor(), OpenAIExtractor(), ExtractionValidator()
+def get_doc_extractor():
+    return DocumentIntelligenceExtractor()
 
-doc_extractor, openai_extractor, validator = get_extractors()
+@st.cache_resource
+def get_openai_extractor():
+    return OpenAIExtractor()
+
+@st.cache_resource
+def get_validator():
+    return ExtractionValidator()
+
+# Un seul thread d'arrière-plan partagé par toutes les sessions, pour les tâches dont la page
+# n'attend pas le résultat (préchauffage des connexions)
+@st.cache_resource
+def get_background_executor():
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="warmup")
+
+doc_extractor = get_doc_extractor()
+openai_extractor = get_openai_extractor()
+validator = get_validator()
+
+# Cache des résultats OCR, indexé par l'empreinte SHA-256 du fichier (le fichier n'est pas haché une seconde fois)
+@st.cache_data(ttl="1h", max_entries=64, show_spinner=False)
+def run_ocr(file_hash, _uploaded_file):
+    _uploaded_file.seek(0)
+    return doc_extractor.extract_text_bytes(_uploaded_file)
+
+# Cache de l'extraction structurée, indexé par (modèle, version du prompt, empreinte du texte)
+# Renvoie uniquement les données structurées : le cache est partagé entre sessions, le fichier
+# d'extraction est créé à part pour chaque soumission
+@st.cache_data(ttl="1h", max_entries=64, show_spinner=False)
+def run_structured_extraction(model, prompt_version, text_hash, _text_content):
+    return openai_extractor.extract_structured_data_without_file(_text_content)
+
+# Cache de la validation, indexé par la sérialisation des données structurées et l'empreinte du fichier OCR
+@st.cache_data(max_entries=32, show_spinner=False)
+def run_validation(structured_key, ocr_hash, _structured_result, _ocr_result):
+    return validator.validate_extracted_data(_structured_result, _ocr_result)
 
 # Zone de téléchargement
 uploaded_file = st.file_uploader(
@@ -48,50 +85,315 @@ uploaded_file = st.file_uploader(
     help="Accepted formats: PDF, JPG"
 )
 
-# Fonction pour convertir un dictionnaire imbriqué en liste de paires clé-valeur plates
-def flatten_dict(d, parent_key=''):
-    items = []
-    for k, v in d.items():
-        new_key = f"{parent_key}.{k}" if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, new_key))
+# Dictionnaire pour des libellés plus descriptifs des champs
+FIELD_LABELS = {
+    # Personal information
+    "lastName": "Last Name",
+    "firstName": "First Name",
+    "idNumber": "ID Number",
+    "gender": "Gender",
+    
+    # Date of birth
+    "dateOfBirth.day": "Day",
+    "dateOfBirth.month": "Month",
+    "dateOfBirth.year": "Year",
+    
+    # Address
+    "address.street": "Street",
+    "address.houseNumber": "House Number",
+    "address.entrance": "Entrance",
+    "address.apartment": "Apartment",
+    "address.city": "City",
+    "address.postalCode": "Postal Code",
+    "address.poBox": "P.O. Box",
+    
+    # Contacts
+    "landlinePhone": "Landline Phone",
+    "mobilePhone": "Mobile Phone",
+    
+    # Employment
+    "jobType": "Job Type",
+    
+    # Accident
+    "dateOfInjury.day": "Day",
+    "dateOfInjury.month": "Month",
+    "dateOfInjury.year": "Year",
+    "timeOfInjury": "Time of Injury",
+    "accidentLocation": "Accident Location",
+    "accidentAddress": "Accident Address",
+    "accidentDescription": "Accident Description",
+    "injuredBodyPart": "Injured Body Part",
+    
+    # Form details
+    "signature": "Signature",
+    "formFillingDate.day": "Day",
+    "formFillingDate.month": "Month",
+    "formFillingDate.year": "Year",
+    "formReceiptDateAtClinic.day": "Day",
+    "formReceiptDateAtClinic.month": "Month",
+    "formReceiptDateAtClinic.year": "Year",
+    
+    # Medical information
+    "medicalInstitutionFields.healthFundMember": "Health Fund Member",
+    "medicalInstitutionFields.natureOfAccident": "Nature of Accident",
+    "medicalInstitutionFields.medicalDiagnoses": "Medical Diagnoses"
+}
+
+# Libellés de contexte pour les composants de date
+CONTEXT_LABELS = {
+    "dateOfBirth": "Date of Birth",
+    "dateOfInjury": "Date of Injury",
+    "formFillingDate": "Form Filling Date",
+    "formReceiptDateAtClinic": "Form Receipt Date at Clinic"
+}
+
+# Titres plus descriptifs des sections
+SECTION_TITLES = {
+    "Personal Information": "🧑 Personal Information",
+    "Date of Birth": "🎂 Date of Birth",
+    "Address": "🏠 Address",
+    "Contact Information": "📱 Contact Information",
+    "Job Information": "💼 Job Information",
+    "Injury Information": "🩹 Injury Information",
+    "Form Details": "📝 Form Details",
+    "Medical Institution Information": "🏥 Medical Institution Information"
+}
+
+# Organiser les champs selon la structure requise dans le README
+SECTIONS = {
+    "Personal Information": ["lastName", "firstName", "idNumber", "gender"],
+    "Date of Birth": ["dateOfBirth.day", "dateOfBirth.month", "dateOfBirth.year"],
+    "Address": ["address.street", "address.houseNumber", "address.entrance", 
+             "address.apartment", "address.city", "address.postalCode", "address.poBox"],
+    "Contact Information": ["landlinePhone", "mobilePhone"],
+    "Job Information": ["jobType"],
+    "Injury Information": ["dateOfInjury.day", "dateOfInjury.month", "dateOfInjury.year", 
+                      "timeOfInjury", "accidentLocation", "accidentAddress", 
+                      "accidentDescription", "injuredBodyPart"],
+    "Form Details": ["signature", 
+                   "formFillingDate.day", "formFillingDate.month", "formFillingDate.year",
+                   "formReceiptDateAtClinic.day", "formReceiptDateAtClinic.month", "formReceiptDateAtClinic.year"],
+    "Medical Institution Information": ["medicalInstitutionFields.healthFundMember", 
+                                    "medicalInstitutionFields.natureOfAccident",
+                                    "medicalInstitutionFields.medicalDiagnoses"]
+}
+
+# Sections avec beaucoup de champs, affichées sur une seule colonne
+SINGLE_COLUMN_SECTIONS = frozenset({"Address", "Injury Information", "Medical Institution Information"})
+
+# Index inverse clé -> section, pour répartir les champs en un seul passage
+KEY_TO_SECTION = {key: name for name, keys in SECTIONS.items() for key in keys}
+
+# Fonction pour obtenir le libellé amélioré d'un champ
+def get_field_label(key, field_parts):
+    # Vérifier si on a un libellé personnalisé
+    if key in FIELD_LABELS:
+        base_label = FIELD_LABELS[key]
+    else:
+        # Sinon, utiliser le nom du champ
+        base_label = field_parts[-1].capitalize()
+        
+    # Contextualiser les dates
+    if field_parts[-1] in ["day", "month", "year"] and len(field_parts) > 1:
+        context = field_parts[-2]
+        context_label = CONTEXT_LABELS.get(context) or context.capitalize()
+        return f"{context_label} - {base_label}"
+    
+    return base_label
+
+# Chemins découpés, libellés et clés de widgets calculés une fois pour tous les champs du formulaire
+FIELD_PATHS = {key: tuple(key.split('.')) for keys in SECTIONS.values() for key in keys}
+FIELD_DISPLAY_LABELS = {key: get_field_label(key, parts) for key, parts in FIELD_PATHS.items()}
+EDITOR_KEYS = {
+    name: (f"editor_{name}",) if name in SINGLE_COLUMN_SECTIONS else (f"editor_{name}_0", f"editor_{name}_1")
+    for name in SECTIONS
+}
+
+# Générateur des paires clé-valeur plates d'un dictionnaire imbriqué
+# (parcours itératif avec une pile d'itérateurs, l'ordre des clés est conservé)
+# list(flatten_dict(d)) ou dict(flatten_dict(d)) selon le besoin, sans liste intermédiaire
+def flatten_dict(d):
+    stack = deque([("", iter(d.items()))])
+    while stack:
+        prefix, it = stack[-1]
+        for k, v in it:
+            new_key = f"{prefix}.{k}" if prefix else k
+            if type(v) is dict:
+                stack.append((new_key, iter(v.items())))
+                break
+            yield new_key, v
         else:
-            items.append((new_key, v))
-    return items
+            stack.pop()
 
-# Fonction pour reconstruire un dictionnaire imbriqué à partir d'une liste de paires clé-valeur plates
+# Aplatir une seule fois par résultat et partager la liste entre les différents affichages
+def get_flat_items(structured_result):
+    cached = st.session_state.get("_flat_items")
+    # st.cache_data renvoie une copie à chaque rerun : comparer aussi par valeur
+    if cached is not None and (cached[0] is structured_result or cached[0] == structured_result):
+        return cached[1]
+    flat_items = list(flatten_dict(structured_result))
+    st.session_state["_flat_items"] = (structured_result, flat_items)
+    return flat_items
+
+# Fonction pour reconstruire un dictionnaire imbriqué à partir d'une liste de paires
+# (chemin déjà découpé, valeur), ex. (("address", "city"), "Haifa")
 def rebuild_dict(flat_items):
     result = {}
-    for key, value in flat_items:
-        parts = key.split('.')
+    for parts, value in flat_items:
         d = result
         for part in parts[:-1]:
-            if part not in d:
-                d[part] = {}
-            d = d[part]
+            d = d.setdefault(part, {})
         d[parts[-1]] = value
     return result
 
+# Afficher un tableau éditable (libellé, valeur) et renvoyer les valeurs saisies, dans l'ordre des lignes
+def render_section_editor(rows, editor_key):
+    if not rows:
+        return []
+    edited_df = st.data_editor(
+        pd.DataFrame.from_records(rows, columns=["Field", "Value"]),
+        key=editor_key,
+        num_rows="fixed",
+        hide_index=True,
+        use_container_width=True,
+        disabled=["Field"],
+        column_config={"Value": st.column_config.TextColumn("Value")}
+    )
+    return ["" if value is None else value for value in edited_df["Value"].tolist()]
+
+# Statut d'un champ dans le tableau de détails de la validation
+def get_field_status(key, value, invalid_map, missing_set):
+    # Un champ requis manquant l'emporte sur une erreur de format
+    if not value and key in missing_set:
+        return "⚠️ Missing required field"
+    invalid = invalid_map.get(key)
+    if invalid is not None:
+        return f"❌ Invalid: {invalid['reason']}"
+    return "✅ Valid"
+
+# Formulaire d'édition isolé dans un fragment : une soumission ne relance que le formulaire,
+# pas l'OCR, la validation ni le reste de la page
+@st.fragment
+def render_edit_form(structured_result, extraction_file):
+    with st.form("structured_data_form", clear_on_submit=False):
+        # Aplatir le dictionnaire pour faciliter l'édition
+        flat_items = get_flat_items(structured_result)
+        
+        # Répartir les champs par section en un seul passage
+        section_buckets = {name: [] for name in SECTIONS}
+        for key, value in flat_items:
+            section_name = KEY_TO_SECTION.get(key)
+            if section_name is not None:
+                section_buckets[section_name].append((key, value))
+        
+        # Stocker les entrées modifiées
+        edited_items = []
+        
+        # Pour chaque section, créer un en-tête et afficher les champs
+        for section_name, section_items in section_buckets.items():
+            # Utiliser un titre amélioré pour la section
+            st.subheader(SECTION_TITLES.get(section_name, section_name))
+            
+            # Préparer une ligne (libellé, valeur) par champ de la section
+            section_paths = []
+            rows = []
+            for key, value in section_items:
+                # Parties du champ (réutilisées par rebuild_dict à la soumission) et libellé amélioré
+                section_paths.append(FIELD_PATHS[key])
+                rows.append({"Field": FIELD_DISPLAY_LABELS[key], "Value": "" if value is None else str(value)})
+            
+            # Un tableau éditable par colonne au lieu d'un text_input par champ
+            if rows:
+                if section_name in SINGLE_COLUMN_SECTIONS:
+                    # Sections avec beaucoup de champs: une colonne
+                    edited_values = render_section_editor(rows, EDITOR_KEYS[section_name][0])
+                else:
+                    # Autres sections: deux colonnes, champs répartis en alternance comme auparavant
+                    edited_values = [""] * len(rows)
+                    for col_idx, (col, editor_key) in enumerate(zip(st.columns(2), EDITOR_KEYS[section_name])):
+                        with col:
+                            edited_values[col_idx::2] = render_section_editor(rows[col_idx::2], editor_key)
+                edited_items.extend(zip(section_paths, edited_values))
+            
+            # Ajouter un séparateur entre les sections
+            st.markdown("---")
+        
+        # Soumettre le formulaire
+        submit_button = st.form_submit_button("Update Data")
+        
+        if submit_button:
+            # Convertir la liste de paires clé-valeur en dictionnaire
+            final_result = rebuild_dict(edited_items)
+            
+            # Valider les données modifiées
+            validator.validate_extraction(final_result)
+            
+            # Exporter les données
+            if "extraction_result" in st.session_state:
+                try:
+                    # Enregistrer les modifications dans le fichier d'extraction d'origine
+                    if extraction_file:
+                        logging.info(f"Mise à jour du fichier d'extraction: {extraction_file}")
+                        
+                        # Lire le fichier existant
+                        with open(extraction_file, 'rb') as f:
+                            extraction_data = orjson.loads(f.read())
+                        
+                        # Mettre à jour les données
+                        extraction_data["final_extraction"] = final_result
+                        extraction_data["has_been_corrected"] = True
+                        extraction_data["last_update"] = datetime.datetime.now().isoformat()
+                        
+                        # Enregistrer le fichier mis à jour (orjson écrit directement de l'UTF-8)
+                        with open(extraction_file, 'wb') as f:
+                            f.write(orjson.dumps(extraction_data, option=orjson.OPT_INDENT_2))
+                                
+                        logging.info(f"Fichier d'extraction mis à jour avec succès")
+                        st.session_state["extraction_updated"] = True
+                    else:
+                        logging.warning("Aucun fichier d'extraction trouvé en session")
+                        st.session_state["extraction_updated"] = False
+                
+                except Exception as e:
+                    logging.error(f"Erreur lors de la mise à jour du fichier d'extraction: {str(e)}")
+                    import traceback
+                    logging.error(traceback.format_exc())
+                    st.session_state["extraction_updated"] = False
+                
+                # Mettre à jour les données en session
+                st.session_state["extraction_result"] = final_result
+            
+            success_msg = "✅ Data updated successfully!"
+            if st.session_state.get("extraction_updated", False):
+                success_msg += " Extraction file updated."
+            st.success(success_msg)
+
 if uploaded_file is not None:
     # Créer deux colonnes
     col1, col2 = st.columns([1, 2])
     
     with st.spinner("Processing..."):
-        # Créer un fichier temporaire
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_path = tmp_file.name
-
         try:
             # Étape 1: Extraction OCR
             with st.status("OCR extraction in progress...") as status:
-                ocr_result = doc_extractor.extract_text(tmp_path)
+                # Le fichier téléchargé est déjà en mémoire : il est haché sur place et envoyé tel quel
+                # à l'OCR, sans fichier temporaire ni copie de son contenu (getvalue)
+                with uploaded_file.getbuffer() as file_view:
+                    file_hash = hashlib.sha256(file_view).hexdigest()
+                file_size = uploaded_file.size
+                
+                # Préchauffer la connexion Azure OpenAI en parallèle de l'OCR, sans attendre la fin
+                # du préchauffage (ni créer de thread) à chaque exécution de la page
+                get_background_executor().submit(openai_extractor.warmup)
+                ocr_result = run_ocr(file_hash, uploaded_file)
                 status.update(label="OCR completed ✅")
                 
+                # Extraire uniquement le texte (sans les scores de confiance), une seule fois
+                # pour l'affichage et pour l'envoi à OpenAI
+                extracted_text = "\n".join([span.get("text", "") for span in ocr_result.get("text", [])])
+                
                 with col1:
                     st.subheader("Extracted Text")
-                    # Extraire uniquement le texte (sans les scores de confiance)
-                    extracted_text = "\n".join([span.get("text", "") for span in ocr_result.get("text", [])])
                     st.text_area(
                         "Raw Text",
                         value=extracted_text,
@@ -102,23 +404,22 @@ if uploaded_file is not None:
             # Étape 2: Extraction structurée
             with st.status("Content analysis in progress...") as status:
                 # Envoyer uniquement le contenu textuel à OpenAI, pas les métadonnées OCR
-                text_content = "\n".join([span.get("text", "") for span in ocr_result.get("text", [])])
-                structured_result = openai_extractor.extract_structured_data(text_content)
-                
-                # Récupérer le chemin du fichier d'extraction
-                extraction_files = []
-                extraction_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "extractions")
-                if os.path.exists(extraction_dir):
-                    files = os.listdir(extraction_dir)
-                    # Trier par date de modification (le plus récent en premier)
-                    files.sort(key=lambda x: os.path.getmtime(os.path.join(extraction_dir, x)), reverse=True)
-                    extraction_files = [os.path.join(extraction_dir, f) for f in files if f.endswith('.json')]
+                text_content = extracted_text
+                text_hash = hashlib.sha256(text_content.encode("utf-8")).hexdigest()
+                structured_result = run_structured_extraction(
+                    AZURE_OPENAI_DEPLOYMENT_NAME,
+                    OpenAIExtractor.PROMPT_VERSION,
+                    text_hash,
+                    text_content
+                )
                 
-                if extraction_files:
-                    # Prendre le fichier le plus récent
-                    latest_file = extraction_files[0]
-                    st.session_state["extraction_file"] = latest_file
-                    logging.info(f"Fichier d'extraction associé: {latest_file}")
+                # Un fichier d'extraction par soumission, créé une seule fois et gardé en session :
+                # les corrections d'un utilisateur n'écrasent jamais celles d'une autre session
+                if st.session_state.get("extraction_upload_id") != uploaded_file.file_id:
+                    extraction_file = openai_extractor.save_extraction(structured_result)
+                    st.session_state["extraction_file"] = extraction_file
+                    st.session_state["extraction_upload_id"] = uploaded_file.file_id
+                    logging.info(f"Fichier d'extraction associé: {extraction_file}")
                 
                 status.update(label="Analysis completed ✅")
                 
@@ -133,234 +434,39 @@ if uploaded_file is not None:
                     # Ajouter une section de débogage pour identifier la source du problème
                     with st.expander("Debug Information (Technical)"):
                         st.markdown("### Flattened Structure")
-                        flat_items = flatten_dict(structured_result)
+                        flat_items = get_flat_items(structured_result)
                         flat_dict = dict(flat_items)
                         st.json(flat_dict)
                     
                     # Créer un formulaire pour les données structurées
-                    with st.form("structured_data_form", clear_on_submit=False):
-                        # Dictionnaire pour des libellés plus descriptifs des champs
-                        field_labels = {
-                            # Personal information
-                            "lastName": "Last Name",
-                            "firstName": "First Name",
-                            "idNumber": "ID Number",
-                            "gender": "Gender",
-                            
-                            # Date of birth
-                            "dateOfBirth.day": "Day",
-                            "dateOfBirth.month": "Month",
-                            "dateOfBirth.year": "Year",
-                            
-                            # Address
-                            "address.street": "Street",
-                            "address.houseNumber": "House Number",
-                            "address.entrance": "Entrance",
-                            "address.apartment": "Apartment",
-                            "address.city": "City",
-                            "address.postalCode": "Postal Code",
-                            "address.poBox": "P.O. Box",
-                            
-                            # Contacts
-                            "landlinePhone": "Landline Phone",
-                            "mobilePhone": "Mobile Phone",
-                            
-                            # Employment
-                            "jobType": "Job Type",
-                            
-                            # Accident
-                            "dateOfInjury.day": "Day",
-                            "dateOfInjury.month": "Month",
-                            "dateOfInjury.year": "Year",
-                            "timeOfInjury": "Time of Injury",
-                            "accidentLocation": "Accident Location",
-                            "accidentAddress": "Accident Address",
-                            "accidentDescription": "Accident Description",
-                            "injuredBodyPart": "Injured Body Part",
-                            
-                            # Form details
-                            "signature": "Signature",
-                            "formFillingDate.day": "Day",
-                            "formFillingDate.month": "Month",
-                            "formFillingDate.year": "Year",
-                            "formReceiptDateAtClinic.day": "Day",
-                            "formReceiptDateAtClinic.month": "Month",
-                            "formReceiptDateAtClinic.year": "Year",
-                            
-                            # Medical information
-                            "medicalInstitutionFields.healthFundMember": "Health Fund Member",
-                            "medicalInstitutionFields.natureOfAccident": "Nature of Accident",
-                            "medicalInstitutionFields.medicalDiagnoses": "Medical Diagnoses"
-                        }
-                        
-                        # Fonction pour obtenir le libellé amélioré d'un champ
-                        def get_field_label(key, field_parts):
-                            # Vérifier si on a un libellé personnalisé
-                            if key in field_labels:
-                                base_label = field_labels[key]
-                            else:
-                                # Sinon, utiliser le nom du champ
-                                base_label = field_parts[-1].capitalize()
-                                
-                            # Contextualiser les dates
-                            if field_parts[-1] in ["day", "month", "year"] and len(field_parts) > 1:
-                                context = field_parts[-2]
-                                if context == "dateOfBirth":
-                                    context_label = "Date of Birth"
-                                elif context == "dateOfInjury":
-                                    context_label = "Date of Injury"
-                                elif context == "formFillingDate":
-                                    context_label = "Form Filling Date"
-                                elif context == "formReceiptDateAtClinic":
-                                    context_label = "Form Receipt Date at Clinic"
-                                else:
-                                    context_label = context.capitalize()
-                                    
-                                return f"{context_label} - {base_label}"
-                            
-                            return base_label
-                        
-                        # Aplatir le dictionnaire pour faciliter l'édition
-                        flat_items = flatten_dict(structured_result)
-                        
-                        # Titres plus descriptifs des sections
-                        section_titles = {
-                            "Personal Information": "🧑 Personal Information",
-                            "Date of Birth": "🎂 Date of Birth",
-                            "Address": "🏠 Address",
-                            "Contact Information": "📱 Contact Information",
-                            "Job Information": "💼 Job Information",
-                            "Injury Information": "🩹 Injury Information",
-                            "Form Details": "📝 Form Details",
-                            "Medical Institution Information": "🏥 Medical Institution Information"
-                        }
-                        
-                        # Organiser les champs selon la structure requise dans le README
-                        sections = {
-                            "Personal Information": ["lastName", "firstName", "idNumber", "gender"],
-                            "Date of Birth": ["dateOfBirth.day", "dateOfBirth.month", "dateOfBirth.year"],
-                            "Address": ["address.street", "address.houseNumber", "address.entrance", 
-                                     "address.apartment", "address.city", "address.postalCode", "address.poBox"],
-                            "Contact Information": ["landlinePhone", "mobilePhone"],
-                            "Job Information": ["jobType"],
-                            "Injury Information": ["dateOfInjury.day", "dateOfInjury.month", "dateOfInjury.year", 
-                                              "timeOfInjury", "accidentLocation", "accidentAddress", 
-                                              "accidentDescription", "injuredBodyPart"],
-                            "Form Details": ["signature", 
-                                           "formFillingDate.day", "formFillingDate.month", "formFillingDate.year",
-                                           "formReceiptDateAtClinic.day", "formReceiptDateAtClinic.month", "formReceiptDateAtClinic.year"],
-                            "Medical Institution Information": ["medicalInstitutionFields.healthFundMember", 
-                                                            "medicalInstitutionFields.natureOfAccident",
-                                                            "medicalInstitutionFields.medicalDiagnoses"]
-                        }
-                        
-                        # Stocker les entrées modifiées
-                        edited_items = []
-                        
-                        # Pour chaque section, créer un en-tête et afficher les champs
-                        for section_name, section_fields in sections.items():
-                            # Utiliser un titre amélioré pour la section
-                            st.subheader(section_titles.get(section_name, section_name))
-                            
-                            # Organiser en colonnes pour une meilleure présentation
-                            if section_name in ["Address", "Injury Information", "Medical Institution Information"]:
-                                # Sections avec beaucoup de champs: une colonne
-                                cols = [st.container()]
-                                col_count = 1
-                            else:
-                                # Autres sections: deux colonnes
-                                cols = st.columns(2)
-                                col_count = 2
-                            
-                            col_idx = 0
-                            
-                            # Parcourir tous les champs à plat
-                            for key, value in flat_items:
-                                # Vérifier si cette clé appartient à cette section
-                                if any(field in key for field in section_fields):
-                                    # Obtenir les parties du champ
-                                    field_parts = key.split('.')
-                                    
-                                    # Obtenir un libellé amélioré
-                                    label = get_field_label(key, field_parts)
-                                    
-                                    # Créer une clé unique pour chaque input
-                                    unique_key = f"input_{key.replace('.', '_')}"
-                                    
-                                    # Afficher le champ dans la colonne appropriée
-                                    with cols[col_idx % col_count]:
-                                        edited_value = st.text_input(label, value, key=unique_key)
-                                        edited_items.append((key, edited_value))
-                                        col_idx += 1
-                            
-                            # Ajouter un séparateur entre les sections
-                            st.markdown("---")
-                        
-                        # Soumettre le formulaire
-                        submit_button = st.form_submit_button("Update Data")
-                        
-                        if submit_button:
-                            # Convertir la liste de paires clé-valeur en dictionnaire
-                            final_result = rebuild_dict(edited_items)
-                            
-                            # Valider les données modifiées
-                            validator.validate_extraction(final_result)
-                            
-                            # Exporter les données
-                            if "extraction_result" in st.session_state:
-                                try:
-                                    # Enregistrer les modifications dans le fichier d'extraction d'origine
-                                    if "extraction_file" in st.session_state:
-                                        extraction_file = st.session_state["extraction_file"]
-                                        logging.info(f"Mise à jour du fichier d'extraction: {extraction_file}")
-                                        
-                                        # Lire le fichier existant
-                                        with open(extraction_file, 'r', encoding='utf-8') as f:
-                                            extraction_data = json.load(f)
-                                        
-                                        # Mettre à jour les données
-                                        extraction_data["final_extraction"] = final_result
-                                        extraction_data["has_been_corrected"] = True
-                                        extraction_data["last_update"] = datetime.datetime.now().isoformat()
-                                        
-                                        # Enregistrer le fichier mis à jour
-                                        with open(extraction_file, 'w', encoding='utf-8') as f:
-                                            json.dump(extraction_data, f, ensure_ascii=False, indent=2)
-                                                
-                                        logging.info(f"Fichier d'extraction mis à jour avec succès")
-                                        st.session_state["extraction_updated"] = True
-                                    else:
-                                        logging.warning("Aucun fichier d'extraction trouvé en session")
-                                        st.session_state["extraction_updated"] = False
-                                
-                                except Exception as e:
-                                    logging.error(f"Erreur lors de la mise à jour du fichier d'extraction: {str(e)}")
-                                    import traceback
-                                    logging.error(traceback.format_exc())
-                                    st.session_state["extraction_updated"] = False
-                                
-                                # Mettre à jour les données en session
-                                st.session_state["extraction_result"] = final_result
-                            
-                            success_msg = "✅ Data updated successfully!"
-                            if st.session_state.get("extraction_updated", False):
-                                success_msg += " Extraction file updated."
-                            st.success(success_msg)
+                    render_edit_form(structured_result, st.session_state.get("extraction_file"))
                     
                     # Bouton de téléchargement en dehors du formulaire
-                    json_str = json.dumps(structured_result, ensure_ascii=False, indent=2)
                     st.download_button(
                         label="📥 Download results (JSON)",
-                        data=json_str.encode('utf-8'),
+                        data=orjson.dumps(structured_result, option=orjson.OPT_INDENT_2),
                         file_name="extraction_results.json",
                         mime="application/json"
                     )
             
             # Étape 3: Validation des données
             with st.status("Data validation in progress...") as status:
-                validation_result = validator.validate_extracted_data(structured_result, ocr_result)
+                validation_result = run_validation(
+                    orjson.dumps(structured_result, option=orjson.OPT_SORT_KEYS),
+                    file_hash,
+                    structured_result,
+                    ocr_result
+                )
                 status.update(label="Validation completed ✅")
                 
+                # Scores et leurs pourcentages formatés, calculés une seule fois
+                completeness = validation_result['completeness']['score']
+                accuracy = validation_result['accuracy']['score']
+                ocr_confidence = validation_result['confidence']['score']
+                completeness_pct = f"{completeness:.2%}"
+                accuracy_pct = f"{accuracy:.2%}"
+                ocr_confidence_pct = f"{ocr_confidence:.2%}"
+                
                 # Afficher les résultats de validation
                 st.subheader("Data Validation")
                 
@@ -376,19 +482,16 @@ if uploaded_file is not None:
                 # Afficher les métriques sous forme de jauge
                 metrics_cols = st.columns(3)
                 with metrics_cols[0]:
-                    completeness = validation_result['completeness']['score']
-                    st.metric("Completeness", f"{completeness:.2%}")
+                    st.metric("Completeness", completeness_pct)
                     # Afficher une barre de progression colorée
                     st.progress(completeness)
                 
                 with metrics_cols[1]:
-                    accuracy = validation_result['accuracy']['score']
-                    st.metric("Accuracy", f"{accuracy:.2%}")
+                    st.metric("Accuracy", accuracy_pct)
                     st.progress(accuracy)
                 
                 with metrics_cols[2]:
-                    ocr_confidence = validation_result['confidence']['score']
-                    st.metric("OCR Confidence", f"{ocr_confidence:.2%}")
+                    st.metric("OCR Confidence", ocr_confidence_pct)
                     st.progress(ocr_confidence)
                 
                 # Nouvelle section pour les problèmes importants
@@ -427,7 +530,7 @@ if uploaded_file is not None:
                     issues_list.append({
                         "type": "warning",
                         "title": "Low OCR Confidence",
-                        "message": f"The OCR confidence score is only {ocr_confidence:.2%}, which may lead to extraction errors."
+                        "message": f"The OCR confidence score is only {ocr_confidence_pct}, which may lead to extraction errors."
                     })
                 
                 # Afficher tous les problèmes
@@ -440,28 +543,32 @@ if uploaded_file is not None:
                 else:
                     st.success("✅ No validation issues found! All fields look good.")
                 
-                # Créer des logs lisibles à partir des résultats de validation
-                logs = []
-                logs.append("VALIDATION SUMMARY")
-                logs.append("=" * 40)
-                logs.append(f"COMPLETENESS: {validation_result['completeness']['score']:.2%}")
-                logs.append(f"  - Filled fields: {validation_result['completeness']['filled_fields']}/{validation_result['completeness']['total_fields']}")
-                
-                if validation_result['completeness']['missing_required']:
-                    logs.append(f"  - Missing required fields: {', '.join(validation_result['completeness']['missing_required'])}")
+                # Créer des logs lisibles à partir des résultats de validation (une seule jointure)
+                missing_required = validation_result['completeness']['missing_required']
+                invalid_fields = validation_result['accuracy'].get('invalid_fields', [])
+                if missing_required:
+                    required_line = f"  - Missing required fields: {', '.join(missing_required)}"
                 else:
-                    logs.append("  - All required fields are present")
-                
-                logs.append(f"ACCURACY: {validation_result['accuracy']['score']:.2%}")
-                logs.append(f"  - Valid format fields: {validation_result['accuracy']['valid_format_fields']}/{validation_result['accuracy']['total_fields']}")
-                
-                if 'invalid_fields' in validation_result['accuracy'] and validation_result['accuracy']['invalid_fields']:
-                    logs.append(f"  - Fields with invalid format: {len(validation_result['accuracy']['invalid_fields'])}")
-                    for field_info in validation_result['accuracy']['invalid_fields']:
-                        logs.append(f"    * {field_info['field']}: '{field_info['value']}' - {field_info['reason']}")
-                
-                logs.append(f"OCR CONFIDENCE: {validation_result['confidence']['score']:.2%}")
-                logs.append("=" * 40)
+                    required_line = "  - All required fields are present"
+                invalid_lines = ()
+                if invalid_fields:
+                    invalid_lines = (
+                        f"  - Fields with invalid format: {len(invalid_fields)}",
+                        *(f"    * {field_info['field']}: '{field_info['value']}' - {field_info['reason']}"
+                          for field_info in invalid_fields)
+                    )
+                validation_summary = "\n".join((
+                    "VALIDATION SUMMARY",
+                    "=" * 40,
+                    f"COMPLETENESS: {completeness_pct}",
+                    f"  - Filled fields: {validation_result['completeness']['filled_fields']}/{validation_result['completeness']['total_fields']}",
+                    required_line,
+                    f"ACCURACY: {accuracy_pct}",
+                    f"  - Valid format fields: {validation_result['accuracy']['valid_format_fields']}/{validation_result['accuracy']['total_fields']}",
+                    *invalid_lines,
+                    f"OCR CONFIDENCE: {ocr_confidence_pct}",
+                    "=" * 40
+                ))
                 
                 # Afficher les logs de validation
                 st.subheader("📋 Validation Logs")
@@ -470,7 +577,7 @@ if uploaded_file is not None:
                 log_tabs = st.tabs(["Summary", "Complete Logs", "Field Details"])
                 
                 with log_tabs[0]:
-                    st.text_area("Validation Summary", value="\n".join(logs), height=200)
+                    st.text_area("Validation Summary", value=validation_summary, height=200)
                 
                 with log_tabs[1]:
                     if 'logs' in validation_result:
@@ -485,27 +592,24 @@ if uploaded_file is not None:
                     flat_data = structured_result
                     if isinstance(structured_result, dict):
                         # Créer une représentation plate du dictionnaire pour la lisibilité
-                        flat_items = flatten_dict(structured_result)
+                        flat_items = get_flat_items(structured_result)
                         flat_data = dict(flat_items)
                     
+                    # Indexer une seule fois les champs invalides et les champs requis manquants
+                    invalid_map = {}
+                    for invalid in validation_result['accuracy'].get('invalid_fields', []):
+                        invalid_map.setdefault(invalid['field'], invalid)
+                    missing_set = set(validation_result['completeness'].get('missing_required', []))
+                    
                     # Afficher un tableau des champs pour analyse rapide
-                    field_data = []
-                    for key, value in flat_data.items():
-                        if not key.endswith('confidence') and not key.endswith('confidences'):
-                            status = "✅ Valid"
-                            # Vérifier si le champ est dans la liste des champs invalides
-                            for invalid in validation_result['accuracy'].get('invalid_fields', []):
-                                if invalid['field'] == key:
-                                    status = f"❌ Invalid: {invalid['reason']}"
-                                    break
-                            # Vérifier si c'est un champ requis manquant
-                            if not value and key in validation_result['completeness'].get('missing_required', []):
-                                status = "⚠️ Missing required field"
-                            
-                            field_data.append({"Field": key, "Value": value, "Status": status})
+                    field_data = [
+                        {"Field": key, "Value": value, "Status": get_field_status(key, value, invalid_map, missing_set)}
+                        for key, value in flat_data.items()
+                        if not key.endswith(('confidence', 'confidences'))
+                    ]
                     
                     if field_data:
-                        st.dataframe(pd.DataFrame(field_data), use_container_width=True)
+                        st.dataframe(pd.DataFrame.from_records(field_data), use_container_width=True)
                     else:
                         st.info("No field details available.")
             
@@ -513,8 +617,8 @@ if uploaded_file is not None:
             st.subheader("Document Information")
             doc_info = {
                 "File name": uploaded_file.name,
-                "File size": f"{len(uploaded_file.getvalue()) / 1024:.2f} KB",
-                "OCR quality": f"{ocr_confidence:.2%}",
+                "File size": f"{file_size / 1024:.2f} KB",
+                "OCR quality": ocr_confidence_pct,
                 "Pages processed": ocr_result.get("page_count", 1),
                 "Text elements": len(ocr_result.get("text", [])),
                 "Overall validation score": f"{(completeness + accuracy + ocr_confidence) / 3:.2%}"
@@ -526,13 +630,6 @@ if uploaded_file is not None:
             st.error(f"Error: {str(e)}")
             import traceback
             st.error(traceback.format_exc())
-        
-        finally:
-            # Nettoyer les fichiers temporaires
-            try:
-                os.unlink(tmp_path)
-            except:
-                pass
 
     # Remarque de bas de page
     st.markdown("---")
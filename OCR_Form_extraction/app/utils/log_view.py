@@ -0,0 +1,114 @@
+"""
+Lecture et répartition par catégorie du fichier de log de la validation (onglet "Recent Logs").
+"""
+from dataclasses import dataclass
+from typing import List, Optional
+
+# Marqueurs des catégories de logs affichées dans l'onglet "Recent Logs"
+ISSUE_TERMS = ("LOGIC ERROR", "TYPE SUBSTITUTION", "FORMAT ERROR")
+GENERAL_LOG_TERMS = ("VALIDATION STARTED", "VALIDATION FINISHED", "SUMMARY",
+                     "COMPLETENESS:", "ACCURACY:", "OCR CONFIDENCE:")
+FIELD_VALIDATION_TERMS = ("Checking field", "Format is valid", "Format is invalid")
+
+# Taille de la fin du fichier de log lue au départ (doublée tant que la dernière session n'y figure pas)
+LOG_TAIL_BYTES = 256 * 1024
+
+@dataclass(frozen=True)
+class LogView:
+    """Lignes du fichier de log réparties par catégorie, pour l'onglet "Recent Logs" """
+    lines: List[str]
+    completeness: Optional[str]
+    accuracy: Optional[str]
+    ocr_confidence: Optional[str]
+    missing_fields: List[str]
+    issues: List[str]
+    errors: List[str]
+    general: List[str]
+    validation: List[str]
+    debug: List[str]
+
+def read_log_tail(path: str, size: int) -> List[str]:
+    """
+    Lit la fin du fichier de log. Le fichier grossit sans limite alors que seule la dernière session
+    est affichée : la fenêtre lue est élargie jusqu'à contenir le début de la dernière session.
+    """
+    window = LOG_TAIL_BYTES
+    with open(path, 'rb') as log_file:
+        while True:
+            offset = max(0, size - window)
+            log_file.seek(offset)
+            # Découpage en lignes sur les octets (seuls \n et \r séparent les lignes, comme readlines)
+            lines = [line.decode("utf-8", "replace")
+                     for line in log_file.read(size - offset).splitlines(keepends=True)]
+            if offset > 0:
+                # La première ligne de la fenêtre est probablement tronquée
+                lines = lines[1:]
+            if offset == 0 or any("VALIDATION STARTED" in line for line in lines):
+                return lines
+            window *= 2
+
+def build_log_view(lines: List[str]) -> LogView:
+    """
+    Répartit les lignes de log par catégorie : métriques clés (dernière valeur) et champs manquants
+    sur toutes les lignes, autres catégories sur la dernière session de validation seulement
+    (sur toutes les lignes s'il n'y a pas de session). Une ligne peut appartenir à plusieurs catégories.
+    """
+    completeness = None
+    accuracy = None
+    ocr_confidence = None
+    missing_fields = []
+    for line in lines:
+        if "COMPLETENESS:" in line:
+            completeness = line.split("COMPLETENESS:")[1].strip()
+        elif "ACCURACY:" in line:
+            accuracy = line.split("ACCURACY:")[1].strip()
+        elif "OCR CONFIDENCE:" in line:
+            ocr_confidence = line.split("OCR CONFIDENCE:")[1].strip()
+        if "Missing required fields" in line:
+            missing_fields.append(line)
+    
+    # Début de la dernière session, puis sa fin (première fin après son début, sinon dernière ligne)
+    session_lines = lines
+    last_start_index = next(
+        (i for i in range(len(lines) - 1, -1, -1) if "VALIDATION STARTED" in lines[i]),
+        None
+    )
+    if last_start_index is not None:
+        last_end_index = next(
+            (i for i in range(last_start_index, len(lines)) if "VALIDATION FINISHED" in lines[i]),
+            len(lines) - 1
+        )
+        session_lines = lines[last_start_index:last_end_index + 1]
+    
+    issues = []
+    errors = []
+    seen_error_messages = set()
+    general = []
+    validation = []
+    debug = []
+    for line in session_lines:
+        if "INVALID" in line and "FORMAT" in line:
+            issues.append(line)
+        elif "ERROR:" in line and any(term in line for term in ISSUE_TERMS):
+            issues.append(line)
+        
+        if " ERROR:" in line or " WARNING:" in line:
+            # Éviter les répétitions de messages similaires (même message après l'horodatage) ;
+            # une ligne sans partie message est comparée en entier
+            parts = line.split(":", 3)
+            message = parts[3] if len(parts) > 3 else line
+            if message not in seen_error_messages:
+                seen_error_messages.add(message)
+                errors.append(line)
+        
+        if any(term in line for term in GENERAL_LOG_TERMS):
+            general.append(line)
+        
+        if any(term in line for term in FIELD_VALIDATION_TERMS):
+            validation.append(line)
+        
+        if "DEBUG:" in line:
+            debug.append(line)
+    
+    return LogView(lines, completeness, accuracy, ocr_confidence, missing_fields,
+                   issues, errors, general, validation, debug)
@@ -1,13 +1,21 @@
 import os
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import AzureError
+from azure.core.polling.base_polling import LROBasePolling
+from azure.core.polling.async_base_polling import AsyncLROBasePolling
 from azure.ai.documentintelligence import DocumentIntelligenceClient
+from azure.ai.documentintelligence.aio import DocumentIntelligenceClient as AsyncDocumentIntelligenceClient
 from azure.ai.documentintelligence.models import AnalyzeResult
 from azure.ai.documentintelligence.models import AnalyzeDocumentRequest
 import sys
 import logging
-import base64
-import base64
-from typing import Dict, Any, Optional
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import numpy as np
+from datetime import datetime, timezone
+from typing import Dict, Any, AsyncIterator, IO, List, Optional, Tuple, Union
 
 # Add parent directory to PYTHONPATH
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -17,6 +25,84 @@ from config import AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT, AZURE_DOCUMENT_INTELLIG
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Document Intelligence client shared by all extractors (see DocumentIntelligenceExtractor._get_client)
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+class AsyncRateLimiter:
+    """Token bucket limiting how many requests are started per second."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available, then consume it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class _BackoffPollingMixin:
+    """
+    Poll a long-running operation after a short first delay, then back off exponentially.
+    
+    The SDK default polls every 5 seconds, which adds up to 5s of idle latency to analyses
+    that typically complete within 1-2s. A Retry-After header sent by the service still
+    takes precedence when it asks for a longer wait.
+    """
+
+    def __init__(self, initial_delay: float = 0.25, max_delay: float = 2.0, factor: float = 1.5, **kwargs):
+        super().__init__(timeout=initial_delay, **kwargs)
+        self._next_delay = initial_delay
+        self._max_delay = max_delay
+        self._factor = factor
+
+    def _extract_delay(self) -> float:
+        delay = self._next_delay
+        self._next_delay = min(delay * self._factor, self._max_delay)
+        # Honor throttling hints as the SDK implementation does
+        return max(self._retry_after(), delay)
+
+    def _retry_after(self) -> float:
+        """Delay in seconds requested by the last poll response's retry headers, or 0."""
+        if self._pipeline_response is None:
+            return 0.0
+        headers = self._pipeline_response.http_response.headers
+        for header in ("retry-after-ms", "x-ms-retry-after-ms"):
+            value = headers.get(header)
+            if value:
+                try:
+                    return float(value) / 1000
+                except ValueError:
+                    pass
+        value = headers.get("Retry-After")
+        if not value:
+            return 0.0
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        # HTTP-date form
+        try:
+            return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+
+class BackoffPolling(_BackoffPollingMixin, LROBasePolling):
+    """LROBasePolling with exponential, capped poll intervals."""
+
+class AsyncBackoffPolling(_BackoffPollingMixin, AsyncLROBasePolling):
+    """AsyncLROBasePolling with exponential, capped poll intervals."""
+
 class DocumentIntelligenceExtractor:
     def __init__(self):
         """Initialize the Document Intelligence client."""
@@ -26,12 +112,47 @@ class DocumentIntelligenceExtractor:
         if not endpoint or not key:
             raise ValueError("Azure Document Intelligence credentials not found in environment variables")
             
-        self.client = DocumentIntelligenceClient(endpoint=endpoint, credential=AzureKeyCredential(key))
+        self._endpoint = endpoint
+        self._key = key
+        self.client = self._get_client(endpoint, key)
+        # Bounding box function for the polygon format seen last (see _extract_bounding_box)
+        self._bbox_extractor = self._bbox_from_flat
+
+    @classmethod
+    def _get_client(cls, endpoint: str, key: str) -> DocumentIntelligenceClient:
+        """
+        Return the shared Document Intelligence client, creating it on first use.
+        
+        All extractor instances reuse the same client, and therefore the same connection pool,
+        instead of each paying for its own TLS handshake.
+        
+        Args:
+            endpoint: Document Intelligence endpoint
+            key: Document Intelligence API key
+            
+        Returns:
+            The shared DocumentIntelligenceClient
+        """
+        global _CLIENT
+        if _CLIENT is None:
+            with _CLIENT_LOCK:
+                if _CLIENT is None:
+                    _CLIENT = DocumentIntelligenceClient(
+                        endpoint=endpoint,
+                        credential=AzureKeyCredential(key),
+                        connection_timeout=30,
+                        read_timeout=60
+                    )
+        return _CLIENT
 
     def _extract_bounding_box(self, polygon):
         """
         Extract the bounding box from a polygon returned by the API.
-        Handles both possible polygon formats (list of points or list of coordinates).
+        Handles the possible polygon formats (flat list of coordinates, Point objects, or [x, y] pairs).
+        
+        The format seen last is remembered in self._bbox_extractor and tried first, so in the
+        common case a polygon goes straight to the matching specialized function; the format is
+        only sniffed again when that function fails.
         
         Args:
             polygon: List of points or coordinates representing the polygon
@@ -42,46 +163,140 @@ class DocumentIntelligenceExtractor:
         try:
             if not polygon:
                 return {"x": 0, "y": 0, "width": 100, "height": 20}
-                
-            # If polygon is a list of Point objects with x and y attributes
-            if hasattr(polygon[0], 'x') and hasattr(polygon[0], 'y'):
-                # Format with Point objects
-                x_coordinates = [p.x for p in polygon]
-                y_coordinates = [p.y for p in polygon]
-            # If polygon directly contains numbers (flat list [x1, y1, x2, y2, ...])
-            elif isinstance(polygon[0], (int, float)):
-                if len(polygon) % 2 == 0:
-                    x_coordinates = [polygon[i] for i in range(0, len(polygon), 2)]
-                    y_coordinates = [polygon[i] for i in range(1, len(polygon), 2)]
-                else:
+            try:
+                return self._bbox_extractor(polygon)
+            except (TypeError, AttributeError, IndexError, KeyError, ValueError):
+                extractor = self._select_bbox_extractor(polygon)
+                if extractor is None:
                     # Unknown format, use default values
+                    logger.warning(f"Unrecognized polygon format: {type(polygon[0])}")
                     return {"x": 0, "y": 0, "width": 100, "height": 20}
-            # If polygon is a list of lists/tuples of coordinates [[x1,y1], [x2,y2], ...]
-            elif isinstance(polygon[0], (list, tuple)) and len(polygon[0]) == 2:
-                x_coordinates = [p[0] for p in polygon]
-                y_coordinates = [p[1] for p in polygon]
-            else:
-                # Unknown format, use default values
-                logger.warning(f"Unrecognized polygon format: {type(polygon[0])}")
-                return {"x": 0, "y": 0, "width": 100, "height": 20}
-                    
-            # Calculate bounding box dimensions
-            min_x = min(x_coordinates)
-            min_y = min(y_coordinates)
-            max_x = max(x_coordinates)
-            max_y = max(y_coordinates)
-            
-            return {
-                "x": min_x,
-                "y": min_y,
-                "width": max_x - min_x,
-                "height": max_y - min_y
-            }
+                self._bbox_extractor = extractor
+                return extractor(polygon)
         except Exception as e:
             logger.warning(f"Error extracting bounding box: {str(e)}")
             # In case of error, return a default box
             return {"x": 0, "y": 0, "width": 100, "height": 20}
 
+    def _select_bbox_extractor(self, polygon):
+        """Return the specialized bounding box function matching the polygon format, or None."""
+        # Flat list of numbers [x1, y1, x2, y2, ...]: the format returned by the current API
+        if isinstance(polygon[0], (int, float)):
+            return self._bbox_from_flat
+        # List of Point objects with x and y attributes
+        if hasattr(polygon[0], 'x') and hasattr(polygon[0], 'y'):
+            return self._bbox_from_points
+        # List of lists/tuples of coordinates [[x1, y1], [x2, y2], ...]
+        if isinstance(polygon[0], (list, tuple)) and len(polygon[0]) == 2:
+            return self._bbox_from_pairs
+        return None
+
+    @staticmethod
+    def _bbox_from_flat(polygon):
+        """Bounding box of a flat list of coordinates [x1, y1, x2, y2, ...]."""
+        if not isinstance(polygon[0], (int, float)):
+            # Another format (Points, [x, y] pairs): let _extract_bounding_box sniff it again
+            raise TypeError(f"Not a flat list of coordinates: {type(polygon[0])}")
+        if len(polygon) % 2:
+            # Unknown format, use default values
+            return {"x": 0, "y": 0, "width": 100, "height": 20}
+        # Strided slices split x and y in C, without a Python-level loop
+        return DocumentIntelligenceExtractor._bbox_from_coordinates(polygon[0::2], polygon[1::2])
+
+    @staticmethod
+    def _bbox_from_points(polygon):
+        """Bounding box of a list of Point objects."""
+        return DocumentIntelligenceExtractor._bbox_from_coordinates([p.x for p in polygon], [p.y for p in polygon])
+
+    @staticmethod
+    def _bbox_from_pairs(polygon):
+        """Bounding box of a list of [x, y] pairs."""
+        return DocumentIntelligenceExtractor._bbox_from_coordinates([p[0] for p in polygon], [p[1] for p in polygon])
+
+    @staticmethod
+    def _bbox_from_coordinates(x_coordinates, y_coordinates):
+        """Bounding box of the given x and y coordinates."""
+        min_x = min(x_coordinates)
+        min_y = min(y_coordinates)
+        return {
+            "x": min_x,
+            "y": min_y,
+            "width": max(x_coordinates) - min_x,
+            "height": max(y_coordinates) - min_y
+        }
+
+    def _extract_bounding_boxes(self, polygons: List[Any]) -> List[Dict[str, float]]:
+        """
+        Extract the bounding boxes of all polygons of a page at once.
+        
+        When every polygon is a flat list of coordinates (or a list of [x, y] pairs) with the same
+        number of points, all boxes are computed with two NumPy reductions over an (N, points, 2)
+        array. Any other input falls back to _extract_bounding_box for each polygon.
+        
+        Args:
+            polygons: List of polygons, one per line or word
+            
+        Returns:
+            List of dicts containing x, y, width and height, in the same order as polygons
+        """
+        if not polygons:
+            return []
+        try:
+            points = np.asarray(polygons, dtype=np.float64)
+        except (TypeError, ValueError):
+            points = None
+        
+        if points is not None and points.size and (
+                (points.ndim == 2 and points.shape[1] % 2 == 0) or (points.ndim == 3 and points.shape[2] == 2)):
+            points = points.reshape(len(polygons), -1, 2)
+            mins = points.min(axis=1)
+            sizes = points.max(axis=1) - mins
+            return [
+                {"x": x, "y": y, "width": width, "height": height}
+                for (x, y), (width, height) in zip(mins.tolist(), sizes.tolist())
+            ]
+        
+        return [self._extract_bounding_box(polygon) for polygon in polygons]
+
+    def _extract_item_bounding_boxes(self, items: List[Any]) -> List[Optional[Dict[str, float]]]:
+        """
+        Extract the bounding boxes of the polygons of lines or words, guarding each item.
+        
+        Args:
+            items: Lines or words of a page
+            
+        Returns:
+            List with one bounding box per item, or None for items whose polygon cannot be read
+        """
+        polygons = []
+        readable = []
+        for item in items:
+            try:
+                polygons.append(item.polygon)
+                readable.append(True)
+            except Exception as e:
+                logger.warning(f"Error reading a polygon: {str(e)}")
+                readable.append(False)
+        
+        bboxes = iter(self._extract_bounding_boxes(polygons))
+        return [next(bboxes) if ok else None for ok in readable]
+
+    @staticmethod
+    def _line_entry(line, bbox: Optional[Dict[str, float]], page_number: int) -> Optional[Dict[str, Any]]:
+        """Return the text entry of one line, or None if the line cannot be processed."""
+        if bbox is None:
+            return None
+        try:
+            return {
+                "text": line.content,
+                "confidence": getattr(line, 'confidence', 0.8),
+                "bounding_box": bbox,
+                "page": page_number
+            }
+        except Exception as e:
+            logger.warning(f"Error processing a line: {str(e)}")
+            return None
+
     def extract_text(self, file_path: str) -> Dict[str, Any]:
         """
         Extract text, tables and layout from a document using Azure Document Intelligence.
@@ -92,87 +307,299 @@ class DocumentIntelligenceExtractor:
         Returns:
             Dict containing extracted text, tables, layout and confidence scores
         """
-        try:
-            with open(file_path, "rb") as f:
-                document_bytes = f.read()
-                base64_encoded = base64.b64encode(document_bytes).decode()
-                
-            # Include parameters in the request object
-            request_data = {
-                "base64Source": base64_encoded,
-                "preprocess": True,
-                "language": "he,en",  # Support for Hebrew and English
-                "pages": "1"  # Process only the first page
-            }
+        # Stream the raw file to the service instead of reading it into memory first
+        with open(file_path, "rb") as f:
+            return self.extract_text_bytes(f)
+
+    def extract_text_bytes(self, data: Union[bytes, IO[bytes]]) -> Dict[str, Any]:
+        """
+        Extract text, tables and layout from an in-memory document (e.g. an upload),
+        without writing it to disk first.
+        
+        Args:
+            data: Raw document content, or a binary file object to read it from
             
-            poller = self.client.begin_analyze_document("prebuilt-layout", request_data)
+        Returns:
+            Dict containing extracted text, tables, layout and confidence scores
+        """
+        try:
+            # Hebrew and English are auto-detected, so no locale hint is passed
+            poller = self.client.begin_analyze_document(
+                "prebuilt-layout",
+                data,
+                content_type="application/octet-stream",
+                pages="1",  # Process only the first page
+                polling=BackoffPolling(path_format_arguments={"endpoint": self._endpoint})
+            )
             result = poller.result()
 
-            # Extract text with confidence scores
-            text_with_confidence = []
-            for page in result.pages:
-                for line in page.lines:
+            return self._build_result(result)
+
+        except Exception as e:
+            logger.error(f"Error extracting text from document: {str(e)}")
+            raise
+
+    async def extract_text_async(self, file_path: str) -> Dict[str, Any]:
+        """
+        Async version of extract_text for a single document.
+        
+        Args:
+            file_path: Path to the document file
+            
+        Returns:
+            Dict containing extracted text, tables, layout and confidence scores
+        """
+        results = await self.extract_texts_async([file_path])
+        return results[0]
+
+    async def extract_texts_async(self, file_paths: List[str], max_concurrent: int = 3,
+                                  requests_per_second: float = 5.0) -> List[Dict[str, Any]]:
+        """
+        Extract several documents concurrently with the async Document Intelligence client.
+        
+        At most max_concurrent analyses are in flight at once (the service default is 3 concurrent
+        requests) and new analyses are started at no more than requests_per_second.
+        
+        Args:
+            file_paths: Paths to the document files
+            max_concurrent: Maximum number of analyses running at the same time
+            requests_per_second: Maximum rate at which analyses are submitted
+            
+        Returns:
+            List of extraction dicts, in the same order as file_paths
+        """
+        results = [None] * len(file_paths)
+        async for index, result in self.iter_texts_async(file_paths, max_concurrent, requests_per_second):
+            results[index] = result
+        return results
+
+    async def iter_texts_async(self, file_paths: List[str], max_concurrent: int = 3,
+                               requests_per_second: float = 5.0) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Extract several documents concurrently and yield each result as soon as it is ready.
+        
+        Same limits as extract_texts_async; lets a caller start working on the first documents
+        while the others are still being analyzed. Pending analyses are cancelled on error.
+        
+        Args:
+            file_paths: Paths to the document files
+            max_concurrent: Maximum number of analyses running at the same time
+            requests_per_second: Maximum rate at which analyses are submitted
+            
+        Yields:
+            (index in file_paths, extraction dict), in completion order
+        """
+        semaphore = asyncio.Semaphore(max_concurrent)
+        rate_limiter = AsyncRateLimiter(requests_per_second)
+        
+        async with AsyncDocumentIntelligenceClient(endpoint=self._endpoint,
+                                                   credential=AzureKeyCredential(self._key)) as client:
+            async def analyze(index, file_path):
+                async with semaphore:
+                    await rate_limiter.acquire()
+                    return index, await self._analyze_async(client, file_path)
+            
+            tasks = [asyncio.ensure_future(analyze(index, file_path)) for index, file_path in enumerate(file_paths)]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield await next_done
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    async def extract_text_pages(self, file_path: str, page_numbers: List[int], max_concurrent: int = 3,
+                                 max_attempts: int = 3,
+                                 max_split_bytes: int = 4 * 1024 * 1024) -> Dict[str, Any]:
+        """
+        Extract several pages of one document, analyzing them concurrently when the file is small.
+        
+        Each page is analyzed with its own request (using the service's pages parameter, so the
+        document does not need to be split locally) and the per-page results are stitched back
+        into a single extraction dict. Page numbers are kept as reported by the service.
+        
+        Every per-page request uploads the whole file, so this only pays off for small documents:
+        files larger than max_split_bytes are analyzed with a single request covering all the
+        requested pages, keeping the upload traffic to one copy of the file.
+        
+        Args:
+            file_path: Path to the document file
+            page_numbers: 1-based numbers of the pages to extract
+            max_concurrent: Maximum number of page analyses running at the same time
+            max_attempts: Number of attempts per request before giving up
+            max_split_bytes: Largest file size, in bytes, analyzed with one request per page
+            
+        Returns:
+            Dict containing extracted text, tables, layout and confidence scores for all pages
+        """
+        # Read the document once; every page request reuses the same bytes
+        with open(file_path, "rb") as f:
+            document_bytes = f.read()
+        
+        if len(document_bytes) > max_split_bytes:
+            page_groups = [",".join(str(page_number) for page_number in page_numbers)]
+        else:
+            page_groups = [str(page_number) for page_number in page_numbers]
+        
+        semaphore = asyncio.Semaphore(max_concurrent)
+        
+        async with AsyncDocumentIntelligenceClient(endpoint=self._endpoint,
+                                                   credential=AzureKeyCredential(self._key)) as client:
+            async def analyze_pages(pages):
+                for attempt in range(1, max_attempts + 1):
                     try:
-                        # Check if polygon is a list of points or direct coordinates
-                        bbox = self._extract_bounding_box(line.polygon)
-                        text_with_confidence.append({
-                            "text": line.content,
-                            "confidence": getattr(line, 'confidence', 0.8),
-                            "bounding_box": bbox,
-                            "page": page.page_number
-                        })
-                    except Exception as e:
-                        logger.warning(f"Error processing a line: {str(e)}")
-
-            # Extract tables
-            tables = []
-            for table in result.tables:
-                table_data = []
-                for cell in table.cells:
-                    table_data.append({
-                        "text": cell.content,
-                        "row_index": cell.row_index,
-                        "column_index": cell.column_index,
-                        "confidence": cell.confidence if hasattr(cell, 'confidence') else None
+                        async with semaphore:
+                            return await self._analyze_async(client, file_path, pages=pages, body=document_bytes)
+                    except AzureError:
+                        if attempt == max_attempts:
+                            raise
+                        delay = 2 ** (attempt - 1)
+                        logger.warning(f"Retrying pages {pages} of {file_path} in {delay}s "
+                                       f"(attempt {attempt}/{max_attempts} failed)")
+                        await asyncio.sleep(delay)
+            
+            results = await asyncio.gather(*(analyze_pages(pages) for pages in page_groups))
+        
+        return self._merge_results(results)
+
+    @staticmethod
+    def _merge_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Stitch several extraction dicts (e.g. one per page) into one, keeping their order.
+        
+        Args:
+            results: Extraction dicts as returned by _build_result
+            
+        Returns:
+            Single extraction dict; the average confidence is recomputed over all words
+        """
+        layout = [page for result in results for page in result["layout"]]
+        confidences = [span["confidence"] for page in layout for span in page["spans"] if span["confidence"] is not None]
+        
+        return {
+            "text": [line for result in results for line in result["text"]],
+            "tables": [table for result in results for table in result["tables"]],
+            "layout": layout,
+            "average_confidence": sum(confidences) / len(confidences) if confidences else 0
+        }
+
+    async def _analyze_async(self, client, file_path: str, pages: str = "1",
+                             body: Optional[bytes] = None) -> Dict[str, Any]:
+        """
+        Analyze one document with an async client and post-process the result.
+        
+        Args:
+            client: Open async DocumentIntelligenceClient
+            file_path: Path to the document file
+            pages: Pages to analyze, in the service's syntax (e.g. "1", "2-3")
+            body: Document bytes already in memory; the file is streamed when omitted
+            
+        Returns:
+            Dict containing extracted text, tables, layout and confidence scores
+        """
+        try:
+            if body is not None:
+                poller = await client.begin_analyze_document(
+                    "prebuilt-layout",
+                    body,
+                    content_type="application/octet-stream",
+                    pages=pages,
+                    polling=AsyncBackoffPolling(path_format_arguments={"endpoint": self._endpoint})
+                )
+            else:
+                with open(file_path, "rb") as f:
+                    poller = await client.begin_analyze_document(
+                        "prebuilt-layout",
+                        f,
+                        content_type="application/octet-stream",
+                        pages=pages,
+                        polling=AsyncBackoffPolling(path_format_arguments={"endpoint": self._endpoint})
+                    )
+            result = await poller.result()
+            
+            return self._build_result(result)
+        
+        except Exception as e:
+            logger.error(f"Error extracting text from document {file_path}: {str(e)}")
+            raise
+
+    def _build_result(self, result) -> Dict[str, Any]:
+        """
+        Convert an AnalyzeResult into the extraction dict returned by extract_text.
+        
+        Args:
+            result: AnalyzeResult returned by the Document Intelligence poller
+            
+        Returns:
+            Dict containing extracted text, tables, layout and confidence scores
+        """
+        # Extract text with confidence scores and layout information in a single pass over the pages,
+        # accumulating the word confidences on the way
+        text_with_confidence = []
+        layout = []
+        confidence_sum = 0.0
+        confidence_count = 0
+        for page in result.pages:
+            # Model attributes are deserialized on every access: read them once per page
+            page_number = page.page_number
+            lines = page.lines
+            words = page.words
+            
+            # Bounding boxes of all the lines of the page in one vectorized pass; a malformed line
+            # only drops that line, not the rest of its page
+            line_bboxes = self._extract_item_bounding_boxes(lines)
+            text_with_confidence.extend([
+                entry
+                for entry in (self._line_entry(line, bbox, page_number) for line, bbox in zip(lines, line_bboxes))
+                if entry is not None
+            ])
+            
+            page_layout = {
+                "page_number": page_number,
+                "width": page.width,
+                "height": page.height,
+                "unit": "points",
+                "spans": []
+            }
+            
+            # Add spans with their positions (all word boxes computed in one vectorized pass)
+            word_bboxes = self._extract_item_bounding_boxes(words)
+            for word, bbox in zip(words, word_bboxes):
+                if bbox is None:
+                    continue
+                try:
+                    confidence = getattr(word, 'confidence', 0.8)
+                    page_layout["spans"].append({
+                        "text": word.content,
+                        "confidence": confidence,
+                        "bounding_box": bbox
                     })
-                tables.append(table_data)
-
-            # Extract layout information
-            layout = []
-            for page in result.pages:
-                page_layout = {
-                    "page_number": page.page_number,
-                    "width": page.width,
-                    "height": page.height,
-                    "unit": "points",
-                    "spans": []
-                }
+                    if confidence is not None:
+                        confidence_sum += confidence
+                        confidence_count += 1
+                except Exception as e:
+                    logger.warning(f"Error processing a word: {str(e)}")
                 
-                # Add spans with their positions
-                for word in page.words:
-                    try:
-                        bbox = self._extract_bounding_box(word.polygon)
-                        page_layout["spans"].append({
-                            "text": word.content,
-                            "confidence": getattr(word, 'confidence', 0.8),
-                            "bounding_box": bbox
-                        })
-                    except Exception as e:
-                        logger.warning(f"Error processing a word: {str(e)}")
-                    
-                layout.append(page_layout)
-
-            # Calculate average confidence
-            confidences = [span["confidence"] for page in layout for span in page["spans"] if span["confidence"] is not None]
-            average_confidence = sum(confidences) / len(confidences) if confidences else 0
+            layout.append(page_layout)
 
-            return {
-                "text": text_with_confidence,
-                "tables": tables,
-                "layout": layout,
-                "average_confidence": average_confidence
-            }
+        # Extract tables
+        tables = [
+            [
+                {
+                    "text": cell.content,
+                    "row_index": cell.row_index,
+                    "column_index": cell.column_index,
+                    "confidence": cell.confidence if hasattr(cell, 'confidence') else None
+                }
+                for cell in table.cells
+            ]
+            for table in result.tables
+        ]
 
-        except Exception as e:
-            logger.error(f"Error extracting text from document: {str(e)}")
-            raise 
\ No newline at end of file
+        average_confidence = confidence_sum / confidence_count if confidence_count else 0
+
+        return {
+            "text": text_with_confidence,
+            "tables": tables,
+            "layout": layout,
+            "average_confidence": average_confidence
+        }
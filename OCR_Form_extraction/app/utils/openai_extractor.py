@@ -3,13 +3,19 @@ from openai import AzureOpenAI
 import os
 import sys
 import json
+import orjson
+import asyncio
 import logging
-from dotenv import load_dotenv
+import threading
+import hashlib
+from collections import OrderedDict
 import uuid
 from datetime import datetime
+from typing import List, Tuple
 
 # Ajouter le répertoire parent au PYTHONPATH
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# config charge le fichier .env une seule fois et valide les credentials
 from config import (
     AZURE_OPENAI_ENDPOINT,
     AZURE_OPENAI_KEY,
@@ -20,26 +26,33 @@ from config import (
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Charger les variables d'environnement
-load_dotenv()
-
-# Récupérer les credentials Azure OpenAI
-AZURE_OPENAI_KEY = os.getenv('AZURE_OPENAI_KEY')
-AZURE_OPENAI_ENDPOINT = os.getenv('AZURE_OPENAI_ENDPOINT')
-AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
-
 # Créer le dossier d'extraction s'il n'existe pas
 EXTRACTION_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "extractions")
 os.makedirs(EXTRACTION_DIR, exist_ok=True)
 
+# Client Azure OpenAI partagé par tous les extracteurs (voir OpenAIExtractor._get_client)
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
 class OpenAIExtractor:
+    # Version du prompt d'extraction : à incrémenter à chaque modification du prompt ou du schéma
+    # (sert de clé aux caches de résultats côté application)
+    PROMPT_VERSION = "1"
+    # Nombre maximal d'extractions gardées en mémoire pour les textes déjà traités
+    CACHE_SIZE = 256
+    # Limites de tokens de la réponse : le JSON attendu fait quelques centaines de tokens, la seconde
+    # limite ne sert qu'à relancer une réponse tronquée (longues descriptions en hébreu)
+    MAX_TOKENS = (1000, 2000)
+
     def __init__(self):
         """Initialise le client Azure OpenAI."""
-        self.client = AzureOpenAI(
-            api_key=AZURE_OPENAI_KEY,
-            api_version="2024-02-15-preview",
-            azure_endpoint=AZURE_OPENAI_ENDPOINT
-        )
+        self.client = self._get_client()
+        self._warmed_up = False
+        
+        # Cache LRU hash du texte -> résultat, partagé entre threads (les fichiers d'extraction
+        # ne sont pas partagés : chaque soumission a le sien)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
         
         # Définir ici exactement la structure JSON attendue selon le README
         self.expected_schema = {
@@ -91,26 +104,17 @@ class OpenAIExtractor:
                 "medicalDiagnoses": ""
             }
         }
-
-    def _create_extraction_prompt(self, text_content: str) -> str:
-        """
-        Crée le prompt pour l'extraction des champs.
         
-        Args:
-            text_content (str): Le texte extrait du document
-            
-        Returns:
-            str: Le prompt formaté
-        """
-        # Créer une représentation JSON du schéma attendu
-        schema_json = json.dumps(self.expected_schema, ensure_ascii=False, indent=2)
-        
-        return f"""Tu es un expert en extraction d'informations à partir de documents en hébreu et en anglais.
+        # Le schéma ne change pas : calculer une seule fois ses chemins de champs, sa sérialisation JSON
+        # et les parties fixes du prompt d'extraction
+        self._schema_paths = self._build_schema_paths(self.expected_schema)
+        self._schema_json = json.dumps(self.expected_schema, ensure_ascii=False, indent=2)
+        self._prompt_prefix = f"""Tu es un expert en extraction d'informations à partir de documents en hébreu et en anglais.
 Je vais te donner le texte extrait d'un formulaire de l'Institut National d'Assurance (ביטוח לאומי).
 Ta tâche est d'extraire les informations pertinentes et de les structurer dans un format JSON précis.
 
 Voici EXACTEMENT le format JSON attendu, respecte STRICTEMENT cette structure sans ajouter de champs supplémentaires :
-{schema_json}
+{self._schema_json}
 
 Important :
 1. Respecte EXACTEMENT cette structure sans AUCUNE modification
@@ -121,12 +125,109 @@ Important :
 6. N'ajoute PAS de scores de confiance ou d'autres métadonnées aux champs
 
 Texte du document:
-{text_content}
+"""
+        self._prompt_suffix = """
 
 Ton rôle est d'extraire toutes les informations pertinentes du texte et de les organiser selon le format JSON spécifié ci-dessus.
 Assure-toi de renvoyer UNIQUEMENT le JSON sans aucun texte supplémentaire.
 """
 
+    @classmethod
+    def _get_client(cls) -> AzureOpenAI:
+        """
+        Renvoie le client Azure OpenAI partagé, créé au premier appel.
+        Toutes les instances réutilisent ainsi le même pool de connexions.
+        
+        Returns:
+            AzureOpenAI: Le client partagé
+        """
+        global _CLIENT
+        if _CLIENT is None:
+            with _CLIENT_LOCK:
+                if _CLIENT is None:
+                    _CLIENT = AzureOpenAI(
+                        api_key=AZURE_OPENAI_KEY,
+                        api_version="2024-02-15-preview",
+                        azure_endpoint=AZURE_OPENAI_ENDPOINT
+                    )
+        return _CLIENT
+
+    @staticmethod
+    def _build_schema_paths(schema: dict) -> List[Tuple[str, ...]]:
+        """
+        Liste les chemins de tous les champs simples du schéma, dans l'ordre du schéma.
+        
+        Args:
+            schema (dict): Le schéma JSON attendu
+            
+        Returns:
+            list: Les chemins, ex. [("lastName",), ("dateOfBirth", "day"), ...]
+        """
+        paths = []
+        stack = [((), iter(schema.items()))]
+        while stack:
+            prefix, it = stack[-1]
+            for key, value in it:
+                # Ignorer explicitement toute clé liée aux confidences
+                if key == 'confidences' or key.endswith('_confidence'):
+                    continue
+                if isinstance(value, dict):
+                    stack.append((prefix + (key,), iter(value.items())))
+                    break
+                paths.append(prefix + (key,))
+            else:
+                stack.pop()
+        return paths
+
+    def _copy_expected_fields(self, source: dict) -> dict:
+        """
+        Copie uniquement les champs définis dans expected_schema, en parcourant les chemins précalculés.
+        Un champ absent (ou dont le parent n'est pas un dictionnaire) vaut "".
+        
+        Args:
+            source (dict): La réponse brute d'OpenAI
+            
+        Returns:
+            dict: Un nouveau dictionnaire respectant exactement la structure du schéma
+        """
+        result = {}
+        for path in self._schema_paths:
+            value_parent = source
+            target = result
+            for part in path[:-1]:
+                value_parent = value_parent.get(part) if isinstance(value_parent, dict) else None
+                target = target.setdefault(part, {})
+            target[path[-1]] = value_parent.get(path[-1], "") if isinstance(value_parent, dict) else ""
+        return result
+
+    def warmup(self) -> None:
+        """
+        Ouvre la connexion HTTPS vers Azure OpenAI (DNS, TLS) avec une requête légère,
+        pour que le premier appel d'extraction n'en paie pas le coût.
+        Sans effet après le premier succès ; un échec est seulement journalisé.
+        """
+        if self._warmed_up:
+            return
+        try:
+            self.client.models.list()
+            self._warmed_up = True
+            logger.info("Connexion Azure OpenAI préchauffée")
+        except Exception as e:
+            logger.warning(f"Échec du préchauffage de la connexion Azure OpenAI: {str(e)}")
+
+    def _create_extraction_prompt(self, text_content: str) -> str:
+        """
+        Crée le prompt pour l'extraction des champs.
+        
+        Args:
+            text_content (str): Le texte extrait du document
+            
+        Returns:
+            str: Le prompt formaté
+        """
+        # Seul le texte du document varie : le reste du prompt est précalculé dans __init__
+        return self._prompt_prefix + text_content + self._prompt_suffix
+
     def extract_structured_data(self, text_content: str) -> dict:
         """
         Extrait les données structurées à partir du texte en utilisant Azure OpenAI.
@@ -137,88 +238,132 @@ Assure-toi de renvoyer UNIQUEMENT le JSON sans aucun texte supplémentaire.
         Returns:
             dict: Les données structurées au format JSON demandé
         """
+        result, _ = self.extract_structured_data_with_file(text_content)
+        return result
+
+    async def extract_structured_data_async(self, text_content: str) -> dict:
+        """
+        Version asynchrone de extract_structured_data : l'appel bloquant s'exécute dans un thread
+        pour ne pas bloquer la boucle d'événements (le client Azure OpenAI est partagé entre threads).
+        
+        Args:
+            text_content (str): Le texte extrait du document
+            
+        Returns:
+            dict: Les données structurées au format JSON demandé
+        """
+        return await asyncio.to_thread(self.extract_structured_data, text_content)
+
+    def extract_structured_data_with_file(self, text_content: str) -> Tuple[dict, str]:
+        """
+        Extrait les données structurées et renvoie aussi le chemin du fichier d'extraction sauvegardé.
+        
+        Args:
+            text_content (str): Le texte extrait du document
+            
+        Returns:
+            tuple: (données structurées, chemin du fichier JSON d'extraction)
+        """
+        result = self.extract_structured_data_without_file(text_content)
+        # Nouveau fichier d'extraction à chaque appel : les corrections d'une soumission n'écrasent pas celles d'une autre
+        return result, self.save_extraction(result)
+
+    def extract_structured_data_without_file(self, text_content: str) -> dict:
+        """
+        Extrait les données structurées sans sauvegarder de fichier d'extraction
+        (voir save_extraction pour l'enregistrer ensuite).
+        
+        Args:
+            text_content (str): Le texte extrait du document
+            
+        Returns:
+            dict: Les données structurées au format JSON demandé
+        """
+        if not isinstance(text_content, str):
+            raise TypeError(f"text_content doit être une chaîne, pas {type(text_content).__name__}")
+        
+        # Un texte déjà extrait (même formulaire soumis à nouveau) ne rappelle pas le modèle
+        text_hash = hashlib.sha256(text_content.encode('utf-8')).hexdigest()
+        with self._cache_lock:
+            cached = self._cache.get(text_hash)
+            if cached is not None:
+                self._cache.move_to_end(text_hash)
+        if cached is not None:
+            logger.info("Extraction structurée servie depuis le cache")
+            # Copie pour que l'appelant puisse modifier le résultat sans altérer le cache
+            return orjson.loads(orjson.dumps(cached))
+        
         try:
             # Créer le prompt
             prompt = self._create_extraction_prompt(text_content)
             
-            # Appeler Azure OpenAI
-            response = self.client.chat.completions.create(
-                model=AZURE_OPENAI_DEPLOYMENT_NAME,
-                messages=[
-                    {"role": "system", "content": "Tu es un assistant expert en extraction de données à partir de documents hébreux et anglais. Tu réponds UNIQUEMENT avec un objet JSON valide selon le format demandé, sans texte supplémentaire et sans ajouter de champs supplémentaires."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0,  # Réduire au minimum la créativité pour une extraction précise
-                max_tokens=2000,
-                response_format={"type": "json_object"}
-            )
+            # Appeler Azure OpenAI ; une réponse tronquée par max_tokens n'est pas un JSON valide :
+            # la relancer avec une limite plus haute au lieu de tenter de la décoder
+            for max_tokens in self.MAX_TOKENS:
+                response = self.client.chat.completions.create(
+                    model=AZURE_OPENAI_DEPLOYMENT_NAME,
+                    messages=[
+                        {"role": "system", "content": "Tu es un assistant expert en extraction de données à partir de documents hébreux et anglais. Tu réponds UNIQUEMENT avec un objet JSON valide selon le format demandé, sans texte supplémentaire et sans ajouter de champs supplémentaires."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.0,  # Réduire au minimum la créativité pour une extraction précise
+                    max_tokens=max_tokens,  # Limite les générations incontrôlées
+                    response_format={"type": "json_object"}
+                )
+                if response.choices[0].finish_reason != "length":
+                    break
+                logger.warning(f"La réponse d'OpenAI a été tronquée à {max_tokens} tokens")
+            else:
+                raise ValueError(f"La réponse d'OpenAI a été tronquée à {self.MAX_TOKENS[-1]} tokens : "
+                                 "le JSON d'extraction est incomplet")
             
             # Extraire le JSON brut de la réponse
-            raw_result = json.loads(response.choices[0].message.content)
-            
-            # IMPORTANT: Supprimer explicitement toute section 'confidences' qui pourrait apparaître
-            if 'confidences' in raw_result:
-                logger.warning("Removing 'confidences' section from OpenAI response")
-                del raw_result['confidences']
+            raw_result = orjson.loads(response.choices[0].message.content)
             
             # Au lieu de modifier la réponse, créer un nouveau dictionnaire en utilisant uniquement les champs attendus
-            result = {}
-            
-            # Fonction récursive pour copier uniquement les champs définis dans expected_schema
-            def copy_expected_fields(source, schema, target):
-                for key, value in schema.items():
-                    # Ignorer explicitement toute clé liée aux confidences
-                    if key == 'confidences' or key.endswith('_confidence'):
-                        continue
-                        
-                    if isinstance(value, dict):
-                        # Si le champ est un dictionnaire imbriqué
-                        if key in source and isinstance(source[key], dict):
-                            target[key] = {}
-                            copy_expected_fields(source[key], schema[key], target[key])
-                        else:
-                            # Si le champ n'existe pas dans la source ou n'est pas un dictionnaire
-                            # créer une structure vide
-                            target[key] = {k: "" for k, v in schema[key].items()}
-                    else:
-                        # Pour les champs simples, copier la valeur si elle existe
-                        target[key] = source.get(key, "")
-            
-            # Copier uniquement les champs attendus
-            copy_expected_fields(raw_result, self.expected_schema, result)
+            # (les sections 'confidences' éventuelles ne font pas partie du schéma et sont donc ignorées)
+            result = self._copy_expected_fields(raw_result)
             
             # Log du résultat final (pour débogage)
             logger.info(f"Extraction structurée réussie avec {len(result)} champs de premier niveau")
             
-            # Vérification finale : s'assurer qu'il n'y a pas de champ 'confidences'
-            if 'confidences' in result:
-                logger.warning("Removing 'confidences' section from final result")
-                del result['confidences']
-            
-            # Sauvegarder le résultat dans un fichier JSON
-            extraction_id = f"extraction_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
-            extraction_file = os.path.join(EXTRACTION_DIR, f"{extraction_id}.json")
-            
-            # Créer le dossier s'il n'existe pas
-            os.makedirs(os.path.dirname(extraction_file), exist_ok=True)
-            
-            # Créer une structure complète pour l'extraction
-            extraction_data = {
-                "id": extraction_id,
-                "timestamp": datetime.now().isoformat(),
-                "original_extraction": result,
-                "final_extraction": result,  # Au début, c'est identique
-                "has_been_corrected": False
-            }
-            
-            # Sauvegarder dans un fichier JSON
-            with open(extraction_file, 'w', encoding='utf-8') as f:
-                json.dump(extraction_data, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"Résultat d'extraction sauvegardé dans: {extraction_file}")
+            with self._cache_lock:
+                self._cache[text_hash] = orjson.loads(orjson.dumps(result))
+                if len(self._cache) > self.CACHE_SIZE:
+                    self._cache.popitem(last=False)
             
             return result
             
         except Exception as e:
             logger.error(f"Erreur lors de l'extraction structurée: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+    @staticmethod
+    def save_extraction(result: dict) -> str:
+        """
+        Sauvegarde un résultat d'extraction dans un nouveau fichier JSON, propre à la soumission.
+        
+        Args:
+            result (dict): Les données structurées extraites
+            
+        Returns:
+            str: Chemin du fichier JSON d'extraction
+        """
+        extraction_id = f"extraction_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        extraction_file = os.path.join(EXTRACTION_DIR, f"{extraction_id}.json")
+        
+        # Créer une structure complète pour l'extraction
+        extraction_data = {
+            "id": extraction_id,
+            "timestamp": datetime.now().isoformat(),
+            "original_extraction": result,
+            "final_extraction": result,  # Au début, c'est identique
+            "has_been_corrected": False
+        }
+        
+        # Sauvegarder dans un fichier JSON (orjson sérialise directement en UTF-8)
+        with open(extraction_file, 'wb') as f:
+            f.write(orjson.dumps(extraction_data, option=orjson.OPT_INDENT_2))
+        
+        logger.info(f"Résultat d'extraction sauvegardé dans: {extraction_file}")
+        return extraction_file
@@ -0,0 +1,65 @@
+"""
+OCR -> structured extraction pipeline for a batch of documents.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List
+
+from .ocr import DocumentIntelligenceExtractor
+from .openai_extractor import OpenAIExtractor
+
+# Logging configuration
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def extract_documents(file_paths: List[str], ocr_extractor: DocumentIntelligenceExtractor,
+                            openai_extractor: OpenAIExtractor, llm_workers: int = 2,
+                            queue_size: int = 8, max_concurrent_ocr: int = 3) -> List[Dict[str, Any]]:
+    """
+    Run OCR and structured extraction over several documents with the two stages overlapped.
+    
+    OCR results are put on a bounded queue as soon as each analysis completes, and llm_workers
+    consumers run the structured extraction on them while the remaining documents are still being
+    analyzed. The bounded queue keeps memory in check if OCR runs ahead of the LLM.
+    
+    Args:
+        file_paths: Paths to the document files
+        ocr_extractor: Document Intelligence extractor
+        openai_extractor: Azure OpenAI extractor
+        llm_workers: Number of structured extractions running at the same time
+        queue_size: Maximum number of OCR results waiting for structured extraction
+        max_concurrent_ocr: Maximum number of OCR analyses running at the same time
+        
+    Returns:
+        List of {"ocr": ..., "structured": ...} dicts, in the same order as file_paths
+    """
+    ocr_queue = asyncio.Queue(maxsize=queue_size)
+    results = [None] * len(file_paths)
+    
+    async def produce():
+        async for index, ocr_result in ocr_extractor.iter_texts_async(file_paths, max_concurrent=max_concurrent_ocr):
+            await ocr_queue.put((index, ocr_result))
+        # One end marker per consumer
+        for _ in range(llm_workers):
+            await ocr_queue.put(None)
+    
+    async def consume():
+        while True:
+            item = await ocr_queue.get()
+            if item is None:
+                return
+            index, ocr_result = item
+            text_content = "\n".join([line.get("text", "") for line in ocr_result.get("text", [])])
+            structured_result = await openai_extractor.extract_structured_data_async(text_content)
+            results[index] = {"ocr": ocr_result, "structured": structured_result}
+            logger.info(f"Document {file_paths[index]} extracted")
+    
+    tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(consume()) for _ in range(llm_workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # If one stage fails, stop the others instead of leaving them blocked on the queue
+        for task in tasks:
+            task.cancel()
+    
+    return results
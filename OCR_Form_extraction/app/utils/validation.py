@@ -1,8 +1,11 @@
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, Iterator, List, NamedTuple, Optional, Tuple
 import re
 from datetime import datetime
+from functools import lru_cache
+from collections import Counter
 import numpy as np
 import logging
+import logging.handlers
 import os
 import json
 
@@ -17,9 +20,143 @@ file_handler = logging.FileHandler(os.path.join(log_dir, "extraction_validation.
 file_handler.setLevel(logging.DEBUG)
 
 # Formater les logs
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', style='%')
 file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+
+# Mettre les logs en mémoire et les écrire en un seul bloc à la fin de chaque validation
+# (écriture immédiate dès qu'une erreur est journalisée ou que le tampon est plein)
+memory_handler = logging.handlers.MemoryHandler(capacity=1024, flushLevel=logging.ERROR, target=file_handler)
+memory_handler.setLevel(logging.DEBUG)
+logger.addHandler(memory_handler)
+
+# Reconnaît les patterns de format composés uniquement d'un nombre fixe (ou borné) de chiffres
+DIGITS_PATTERN_RE = re.compile(r'^\^\\d\{(\d+)(?:,(\d+))?\}\$$')
+
+# Descriptions des formats attendus par type de champ
+EXPECTED_FORMATS = {
+    'numeric': 'sequence of digits',
+    'phone': 'phone number (digits only)',
+    'date': 'date (day/month/year)',
+    'text': 'text (not only digits)',
+    'address': 'address (street, number, city, etc.)'
+}
+
+class BBox(NamedTuple):
+    """Boîte englobante sous forme de coins, validée une seule fois à la lecture des éléments"""
+    x1: float
+    y1: float
+    x2: float
+    y2: float
+
+# Boîte de remplacement des éléments sans boîte englobante complète dans les tableaux NumPy
+MISSING_BBOX = BBox(np.nan, np.nan, np.nan, np.nan)
+
+def to_bbox(bbox: Any) -> Optional[BBox]:
+    """
+    Convertit une boîte englobante {x, y, width, height} en BBox.
+    
+    Args:
+        bbox: Boîte englobante telle que produite par l'OCR
+        
+    Returns:
+        BBox, ou None si la boîte est absente ou incomplète
+    """
+    if not isinstance(bbox, dict):
+        return None
+    try:
+        x, y = bbox['x'], bbox['y']
+        return BBox(x, y, x + bbox['width'], y + bbox['height'])
+    except KeyError:
+        return None
+
+# Contraintes sur la proportion de chiffres, par marqueur de format attendu (testés dans cet ordre) :
+# (marqueur, seuil, True si la proportion doit dépasser le seuil, False si elle doit rester en dessous)
+DIGIT_RATIO_RULES = (
+    ('digits only', 0.7, True),  # Téléphones, codes, etc. : au moins 70% de chiffres
+    ('sequence of digits', 0.9, True),  # IDs, numéros, etc. : au moins 90% de chiffres
+    ('not only digits', 0.5, False),  # Noms, etc. : moins de 50% de chiffres
+)
+
+# Mots-clés des noms de champs par type, dans l'ordre de priorité des types
+FIELD_TYPE_KEYWORDS = (
+    ('numeric', ('id', 'number', 'num', 'code')),
+    ('phone', ('phone', 'tel', 'mobile', 'landline')),
+    ('date', ('date', 'day', 'month', 'year')),
+    ('text', ('name', 'first', 'last', 'family')),
+    ('address', ('address', 'street', 'city')),
+)
+
+# Une seule expression pour tous les types : chaque alternative vérifie par anticipation qu'un
+# de ses mots-clés apparaît dans le nom, et les alternatives sont essayées dans l'ordre de
+# priorité, si bien que le groupe retenu (lastgroup) est le premier type dont un mot-clé apparaît
+FIELD_TYPE_RE = re.compile('|'.join(
+    f"(?=.*?(?:{'|'.join(map(re.escape, keywords))}))(?P<{field_type}>)"
+    for field_type, keywords in FIELD_TYPE_KEYWORDS
+), re.DOTALL)
+
+@lru_cache(maxsize=1024)
+def infer_field_type(field_name: str) -> str:
+    """
+    Infère le type de champ à partir de son nom (résultat mis en cache par nom de champ).
+    
+    Args:
+        field_name: Nom du champ
+        
+    Returns:
+        Type de champ inféré (numeric, text, date, phone, etc.)
+    """
+    type_match = FIELD_TYPE_RE.match(field_name.lower())
+    return type_match.lastgroup if type_match else 'unknown'
+
+@lru_cache(maxsize=4096)
+def digit_ratio(value: str) -> float:
+    """
+    Calcule la proportion de chiffres dans une valeur (résultat mis en cache par valeur).
+    
+    Args:
+        value: Valeur à analyser
+        
+    Returns:
+        Proportion de caractères qui sont des chiffres, 0 pour une valeur vide
+    """
+    if not value:
+        return 0
+    # Cas le plus fréquent (IDs, téléphones) : str.isdigit parcourt la chaîne en C et s'arrête
+    # au premier caractère qui n'est pas un chiffre, sans compter caractère par caractère
+    if value.isdigit():
+        return 1.0
+    return sum(map(str.isdigit, value)) / len(value)
+
+def best_token_match(token: str, ocr_tokens: List[Tuple[str, set, int]], threshold: float = 0.6) -> Tuple[str, float]:
+    """
+    Cherche le token OCR le plus proche d'un token (caractères du token présents dans le token OCR,
+    rapportés à la plus grande des deux longueurs).
+    
+    Args:
+        token: Token recherché
+        ocr_tokens: Tokens OCR (token, ensemble de ses caractères, longueur), voir _build_ocr_index
+        threshold: Score minimal (exclu) pour retenir un token
+        
+    Returns:
+        (token OCR le plus proche ou "", score) ; le premier token OCR gagne en cas d'égalité
+    """
+    token_len = len(token)
+    # Chaque caractère distinct du token n'est testé qu'une fois, pondéré par son nombre d'occurrences
+    token_counts = Counter(token).items()
+    closest_match = ""
+    match_score = 0
+    for ocr_token, ocr_token_chars, ocr_token_len in ocr_tokens:
+        longest = max(token_len, ocr_token_len)
+        # Borne supérieure du score : inutile de compter si elle ne peut pas battre le meilleur score
+        best_possible = token_len / longest
+        if best_possible <= threshold or best_possible <= match_score:
+            continue
+        common = sum(count for c, count in token_counts if c in ocr_token_chars)
+        score = common / longest
+        if score > threshold and score > match_score:  # Seuil de similarité
+            match_score = score
+            closest_match = ocr_token
+    return closest_match, match_score
 
 class ExtractionValidator:
     def __init__(self):
@@ -29,6 +166,16 @@ class ExtractionValidator:
             'landlinePhone': r'^\d{9}$',  # Téléphone fixe israélien
             'postalCode': r'^\d{5,7}$'  # Code postal israélien
         }
+        # Patterns compilés une seule fois (validate_format est appelé pour chaque champ)
+        self._compiled_patterns = {field: re.compile(pattern) for field, pattern in self.field_patterns.items()}
+        # Les patterns de la forme ^\d{N}$ ou ^\d{N,M}$ se réduisent à un test de chiffres et de longueur
+        self._digit_len_rules = {}
+        for field, pattern in self.field_patterns.items():
+            digits_match = DIGITS_PATTERN_RE.match(pattern)
+            if digits_match:
+                min_len = int(digits_match.group(1))
+                max_len = int(digits_match.group(2)) if digits_match.group(2) else min_len
+                self._digit_len_rules[field] = (min_len, max_len)
         
         # Définition des zones attendues pour chaque champ dans le formulaire
         self.expected_zones = {
@@ -44,6 +191,9 @@ class ExtractionValidator:
         # Définir les champs requis (champs qui devraient être remplis)
         self.required_fields = ["lastName", "firstName", "idNumber"]
         
+        # Date de référence de la validation en cours (fixée par validate_extracted_data)
+        self._now = None
+        
         logger.info("ExtractionValidator initialized with %d patterns and %d required fields", 
                    len(self.field_patterns), len(self.required_fields))
 
@@ -56,57 +206,72 @@ class ExtractionValidator:
             logger.debug("Field %s: Empty value - format validation skipped", field)
             return True  # Les champs vides sont acceptés
         
+        # Caractéristiques du champ et de la valeur, calculées une seule fois pour tous les logs
+        field_lc = field.lower()
+        is_id_field = field_lc in ('idnumber', 'id')
+        is_phone_field = field_lc in ('phone', 'mobilephone', 'landlinephone')
+        value_is_digit = value.isdigit()
+        value_len = len(value)
+        
         # Log specific information for important fields like idNumber
-        if field.lower() in ['idnumber', 'id']:
+        if is_id_field:
             logger.info("VALIDATING ID NUMBER FORMAT: '%s'", value)
         
-        pattern = self.field_patterns.get(field)
-        if not pattern:
+        compiled = self._compiled_patterns.get(field)
+        if not compiled:
             logger.debug("Field %s: No pattern defined - format validation skipped", field)
             # Add debug info for important fields even if no pattern
-            if field.lower() in ['idnumber', 'id']:
-                if value.isdigit():
-                    logger.info("ID FORMAT CHECK: ID number '%s' contains only digits (length: %d)", value, len(value))
-                    if len(value) == 9:
+            if is_id_field:
+                if value_is_digit:
+                    logger.info("ID FORMAT CHECK: ID number '%s' contains only digits (length: %d)", value, value_len)
+                    if value_len == 9:
                         logger.info("ID FORMAT IS VALID: ID number '%s' has correct length (9 digits)", value)
                     else:
                         logger.error("ID FORMAT IS INVALID: ID number '%s' has incorrect length (%d digits instead of 9)", 
-                                   value, len(value))
+                                   value, value_len)
                 else:
                     logger.warning("ID FORMAT IS INVALID: ID number '%s' contains non-digit characters", value)
             return True  # Pas de pattern défini pour ce champ
             
-        is_valid = bool(re.match(pattern, value))
+        pattern = compiled.pattern
+        rule = self._digit_len_rules.get(field)
+        if rule:
+            # isdecimal() accepte exactement les caractères reconnus par \d
+            is_valid = value.isdecimal() and rule[0] <= value_len <= rule[1]
+        else:
+            is_valid = bool(compiled.match(value))
         if is_valid:
             logger.info("Field %s: Value '%s' matches the expected pattern %s", 
                        field, value, pattern)
             
             # Additional validation details for specific field types
-            if field.lower() in ['idnumber', 'id']:
+            if is_id_field:
                 logger.info("ID FORMAT IS VALID: ID number '%s' matches pattern: %s", value, pattern)
         else:
             logger.warning("Field %s: Value '%s' does not match the expected pattern %s", 
                           field, value, pattern)
             
             # Detailed error information for specific field types
-            if field.lower() in ['idnumber', 'id']:
+            if is_id_field:
                 logger.error("ID FORMAT IS INVALID: ID number '%s' does not match pattern: %s", value, pattern)
-                if not value.isdigit():
+                if not value_is_digit:
                     logger.error("ID FORMAT ERROR: ID number contains non-digit characters: '%s'", value)
-                elif len(value) != 9:
-                    logger.error("ID FORMAT ERROR: ID number has incorrect length: %d (should be 9)", len(value))
-            elif field.lower() in ['phone', 'mobilephone', 'landlinephone']:
-                if not value.isdigit():
+                elif value_len != 9:
+                    logger.error("ID FORMAT ERROR: ID number has incorrect length: %d (should be 9)", value_len)
+            elif is_phone_field:
+                if not value_is_digit:
                     logger.error("PHONE FORMAT ERROR: Phone number contains non-digit characters: '%s'", value)
                 else:
-                    logger.error("PHONE FORMAT ERROR: Phone number has incorrect length: %d", len(value))
+                    logger.error("PHONE FORMAT ERROR: Phone number has incorrect length: %d", value_len)
         
         return is_valid
 
     def validate_date(self, date_dict: Dict[str, str]) -> Tuple[bool, str]:
         """Valide une date et retourne (validité, message d'erreur)."""
         try:
-            logger.debug("Validating date: %s", json.dumps(date_dict))
+            # Ne sérialiser en JSON que si le message sera effectivement journalisé
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Validating date: %s", json.dumps(date_dict))
             if not all([date_dict.get('day'), date_dict.get('month'), date_dict.get('year')]):
                 logger.info("Date validation: Incomplete date accepted - %s", json.dumps(date_dict))
                 return True, ""  # Date incomplète acceptée
@@ -177,58 +342,64 @@ class ExtractionValidator:
         Returns:
             Dict contenant les résultats de validation
         """
-        validation_scores = []
-        spatial_validations = []
+        validated_spans = []
         
         # Valider les spans de texte
         text_spans = extraction_result.get("text", [])
-        logger.info("Validating %d extracted text spans", len(text_spans))
+        n_spans = len(text_spans)
+        logger.info("Validating %d extracted text spans", n_spans)
+        
+        # Scores de confiance remplis par index dans un tableau préalloué
+        validation_scores = np.empty(n_spans, dtype=np.float64)
+        
+        # Cohérence spatiale de tous les spans entre eux, calculée en une fois pour tout le document
+        # (les tableaux n'ont pas de boîtes englobantes et ne participent pas à la comparaison)
+        spatial_validations = self._spatial_coherence_scores(self._bboxes_to_array(text_spans))
+        
+        # Méthodes du logger liées une seule fois pour la boucle sur les spans
+        log_debug = logger.debug
+        log_warning = logger.warning
         
-        for i, span in enumerate(text_spans[:20]):  # Limiter l'affichage des logs pour les premiers spans
+        for i, span in enumerate(text_spans):
+            # Limiter l'affichage des logs aux premiers spans
+            log_span = i < 20
+            
             # Vérifier le score de confiance
             confidence = span.get("confidence", 0)
             confidence_valid = confidence >= self.min_confidence_threshold
             
-            if confidence_valid:
-                logger.debug("Span #%d: '%s' has sufficient confidence: %.2f >= %.2f", 
-                           i, span.get("text", "")[:30], confidence, self.min_confidence_threshold)
-            else:
-                logger.warning("Span #%d: '%s' has insufficient confidence: %.2f < %.2f", 
-                             i, span.get("text", "")[:30], confidence, self.min_confidence_threshold)
-            
-            # Vérifier la cohérence spatiale avec les autres éléments
-            spatial_score = self._validate_spatial_coherence(
-                span.get("bounding_box", {}),
-                text_spans + extraction_result.get("tables", [])
-            )
+            if log_span:
+                if confidence_valid:
+                    log_debug("Span #%d: '%s' has sufficient confidence: %.2f >= %.2f", 
+                               i, span.get("text", "")[:30], confidence, self.min_confidence_threshold)
+                else:
+                    log_warning("Span #%d: '%s' has insufficient confidence: %.2f < %.2f", 
+                                 i, span.get("text", "")[:30], confidence, self.min_confidence_threshold)
             
-            logger.debug("Span #%d: Spatial coherence score = %.2f", i, spatial_score)
+            spatial_score = float(spatial_validations[i])
+            if log_span:
+                log_debug("Span #%d: Spatial coherence score = %.2f", i, spatial_score)
             
-            validation_scores.append(span.get("confidence", 0))
-            spatial_validations.append(spatial_score)
+            validation_scores[i] = confidence
+            validated_spans.append({
+                "text": span.get("text", ""),
+                "confidence_valid": confidence_valid,
+                "spatial_score": spatial_score
+            })
         
-        if len(text_spans) > 20:
-            logger.debug("... %d more spans omitted from detailed logging", len(text_spans) - 20)
+        if n_spans > 20:
+            logger.debug("... %d more spans omitted from detailed logging", n_spans - 20)
             
         # Calculer les scores globaux
-        avg_confidence = np.mean(validation_scores) if validation_scores else 0.0
-        spatial_confidence = np.mean(spatial_validations) if spatial_validations else 0.0
+        avg_confidence = float(validation_scores.mean()) if n_spans else 0.0
+        spatial_confidence = float(spatial_validations.mean()) if n_spans else 0.0
         
         logger.info("OCR validation completed: average confidence=%.2f, spatial coherence=%.2f", 
                    avg_confidence, spatial_confidence)
+        memory_handler.flush()
         
         return {
-            "validated_spans": [
-                {
-                    "text": span.get("text", ""),
-                    "confidence_valid": span.get("confidence", 0) >= self.min_confidence_threshold,
-                    "spatial_score": self._validate_spatial_coherence(
-                        span.get("bounding_box", {}),
-                        text_spans
-                    )
-                }
-                for span in text_spans
-            ],
+            "validated_spans": validated_spans,
             "global_confidence": (avg_confidence + spatial_confidence) / 2,
             "confidence_metrics": {
                 "average_confidence": avg_confidence,
@@ -247,10 +418,14 @@ class ExtractionValidator:
         Returns:
             dict: Résultats de validation
         """
+        # Une seule lecture de l'horloge pour toutes les vérifications de dates de ce document
+        self._now = datetime.now()
+        
         # Journaliser les données extraites pour référence
         logger.info("==================== VALIDATION STARTED ====================")
         logger.info("Starting validation of ChatGPT extracted data")
-        logger.debug("Structured data: %s", json.dumps(structured_data, ensure_ascii=False))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Structured data: %s", json.dumps(structured_data, ensure_ascii=False))
         
         # Initialiser le résultat
         validation_result = {
@@ -272,22 +447,37 @@ class ExtractionValidator:
             }
         }
         
-        # Aplatir le dictionnaire pour compter facilement les champs
-        flat_data = self._flatten_dict(structured_data)
-        logger.debug("Flattened data for validation: %d fields", len(flat_data))
+        # Aplatir le dictionnaire en un seul parcours qui calcule aussi, pour chaque champ, son texte nettoyé
+        # et son nom (dernier composant de la clé) : (clé, valeur, texte, nom du champ) ; le même parcours
+        # compte les champs remplis, indexe les champs par nom et journalise les champs extraits
+        processed = []
+        by_field_name = {}
+        filled_fields = 0
+        log_fields = logger.isEnabledFor(logging.INFO)
+        # Méthodes du logger liées une seule fois pour les boucles sur les champs
+        log_info = logger.info
+        log_debug = logger.debug
+        log_error = logger.error
         
         # Log all fields that were extracted
-        logger.info("All extracted fields:")
-        for key, value in flat_data.items():
+        if log_fields:
+            log_info("All extracted fields:")
+        for key, value in self._iter_flattened(structured_data):
             value_str = str(value).strip() if value else ""
+            entry = (key, value, value_str, key.rpartition(".")[2])
+            processed.append(entry)
+            by_field_name.setdefault(entry[3], []).append(entry)
             if value_str:
-                logger.info("  - %s: '%s'", key, value_str[:50] + ("..." if len(value_str) > 50 else ""))
-            else:
-                logger.info("  - %s: [EMPTY]", key)
+                filled_fields += 1
+            if log_fields:
+                if value_str:
+                    log_info("  - %s: '%s'", key, value_str[:50] + ("..." if len(value_str) > 50 else ""))
+                else:
+                    log_info("  - %s: [EMPTY]", key)
+        logger.debug("Flattened data for validation: %d fields", len(processed))
         
         # Calculer les métriques d'exhaustivité
-        total_fields = len(flat_data)
-        filled_fields = sum(1 for v in flat_data.values() if v and str(v).strip())
+        total_fields = len(processed)
         
         logger.info("Completeness check: %d/%d fields filled (%.2f%%)", 
                    filled_fields, total_fields, 
@@ -297,50 +487,49 @@ class ExtractionValidator:
         logger.info("Checking required fields:")
         for field in self.required_fields:
             logger.info("Required field check: %s", field)
-            field_found = False
-            
-            for key, value in flat_data.items():
-                if key.endswith(field):
-                    field_found = True
-                    if not (value and str(value).strip()):
-                        validation_result["completeness"]["missing_required"].append(key)
-                        logger.error("  - Required field missing: %s", key)
-                    else:
-                        logger.info("  - Required field present: %s = '%s'", key, value)
+            entries = by_field_name.get(field, [])
+            field_found = bool(entries)
+            
+            for key, value, value_str, _ in entries:
+                if not value_str:
+                    validation_result["completeness"]["missing_required"].append(key)
+                    logger.error("  - Required field missing: %s", key)
+                else:
+                    logger.info("  - Required field present: %s = '%s'", key, value)
             
             if not field_found:
                 logger.warning("  - Required field '%s' not found in structure", field)
         
         # Calculer les métriques d'exactitude
         logger.info("Format validation for all fields:")
-        for key, value in flat_data.items():
-            # Ignorer les champs de score de confiance
-            if 'confidences' in key or 'confidence' in key:
-                logger.debug("  - Skipping confidence field %s - not subject to format validation", key)
+        # Texte OCR préparé une seule fois pour toutes les vérifications de cohérence
+        ocr_index = self._build_ocr_index(ocr_data)
+        for key, value, value_str, field_name in processed:
+            # Ignorer les champs de score de confiance ('confidences' contient déjà 'confidence')
+            if 'confidence' in key:
+                log_debug("  - Skipping confidence field %s - not subject to format validation", key)
                 continue
                 
-            field_name = key.split(".")[-1]
-            
-            if value and str(value).strip():
-                logger.info("Checking field %s = '%s'", key, value)
+            if value_str:
+                log_info("Checking field %s = '%s'", key, value)
                 validation_result["accuracy"]["total_fields"] += 1
                 
                 # Vérifier la cohérence avec les données OCR
-                self._check_consistency_with_ocr(field_name, value, ocr_data)
+                self._check_consistency_with_ocr(field_name, value, ocr_data, ocr_index)
                 
                 # Vérifier le format
                 if self.validate_format(field_name, str(value)):
                     validation_result["accuracy"]["valid_format_fields"] += 1
-                    logger.info("  - Field %s: Format is valid", key)
+                    log_info("  - Field %s: Format is valid", key)
                 else:
                     validation_result["accuracy"]["invalid_fields"].append({
                         "field": key,
                         "value": value,
                         "reason": "Invalid format"
                     })
-                    logger.error("  - Field %s: Format is invalid for value '%s'", key, value)
+                    log_error("  - Field %s: Format is invalid for value '%s'", key, value)
             else:
-                logger.debug("  - Field %s is empty - format validation skipped", key)
+                log_debug("  - Field %s is empty - format validation skipped", key)
         
         # Calculer les scores
         validation_result["completeness"]["filled_fields"] = filled_fields
@@ -364,6 +553,7 @@ class ExtractionValidator:
                           json.dumps(validation_result["accuracy"]["invalid_fields"], ensure_ascii=False))
             
         logger.info("==================== VALIDATION FINISHED ====================")
+        memory_handler.flush()
         
         # IMPORTANT: Ne pas modifier le dictionnaire structured_data original
         # Nous retournons uniquement les résultats de validation, pas les données modifiées
@@ -407,7 +597,31 @@ class ExtractionValidator:
         
         logger.info("=============================================================")
     
-    def _check_consistency_with_ocr(self, field_name: str, value: Any, ocr_data: Dict[str, Any]) -> None:
+    def _build_ocr_index(self, ocr_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Prépare le texte OCR pour les vérifications de cohérence.
+        
+        Args:
+            ocr_data: Données OCR
+            
+        Returns:
+            dict: texte OCR en minuscules ("text"), ensemble de ses caractères ("chars") et
+                  tokens significatifs distincts avec leurs ensembles de caractères et leurs longueurs ("tokens")
+        """
+        # Une seule mise en minuscules sur le texte joint plutôt qu'une par span
+        ocr_text = " ".join([span.get("text", "") for span in ocr_data.get("text", [])]).lower()
+        return {
+            "text": ocr_text,
+            "chars": set(ocr_text),
+            # Ignorer les tokens trop courts ; un token répété n'est gardé qu'une fois (à sa première position)
+            "tokens": [
+                (ocr_token, set(ocr_token), len(ocr_token))
+                for ocr_token in dict.fromkeys(ocr_text.split()) if len(ocr_token) > 3
+            ]
+        }
+
+    def _check_consistency_with_ocr(self, field_name: str, value: Any, ocr_data: Dict[str, Any],
+                                    ocr_index: Optional[Dict[str, Any]] = None) -> None:
         """
         Vérifie la cohérence entre la valeur extraite et les données OCR.
         
@@ -415,6 +629,7 @@ class ExtractionValidator:
             field_name: Nom du champ
             value: Valeur extraite
             ocr_data: Données OCR
+            ocr_index: Texte OCR préparé par _build_ocr_index (calculé ici s'il n'est pas fourni)
         """
         value_str = str(value).lower().strip()
         if not value_str or len(value_str) <= 3:  # Ignorer les valeurs vides ou trop courtes
@@ -422,11 +637,15 @@ class ExtractionValidator:
             return
             
         # Rechercher la valeur dans le texte OCR
-        ocr_text = " ".join([span.get("text", "").lower() for span in ocr_data.get("text", [])])
+        if ocr_index is None:
+            ocr_index = self._build_ocr_index(ocr_data)
+        ocr_text = ocr_index["text"]
         logger.debug("Checking OCR consistency for field %s = '%s'", field_name, value_str)
         
-        # Calcul du score de similarité basique (nombre de caractères communs / longueur)
-        common_chars = sum(1 for c in value_str if c in ocr_text)
+        # Calcul du score de similarité basique (nombre de caractères communs / longueur) ;
+        # le test d'appartenance se fait sur l'ensemble des caractères de l'OCR et non sur le texte entier
+        ocr_char_set = ocr_index["chars"]
+        common_chars = sum(1 for c in value_str if c in ocr_char_set)
         similarity_score = common_chars / len(value_str) if value_str else 0
         logger.debug("Basic similarity score for %s: %.2f", field_name, similarity_score)
         
@@ -467,10 +686,10 @@ class ExtractionValidator:
             return  # Fin du traitement pour les valeurs de type dict
         
         # Détection de substitution de type de valeur
-        field_type = self._infer_field_type(field_name)
+        field_type = infer_field_type(field_name)
         if field_type in ['numeric', 'phone'] and not value_str.replace('-', '').replace(' ', '').isdigit():
             logger.error("TYPE SUBSTITUTION DETECTED: Field '%s' should be %s but contains non-digit characters: '%s'", 
-                        field_name, self._get_expected_format(field_type), value_str)
+                        field_name, EXPECTED_FORMATS.get(field_type, ''), value_str)
         
         if field_type == 'text' and value_str.isdigit():
             logger.error("TYPE SUBSTITUTION DETECTED: Field '%s' (type: text) contains only digits: '%s'", 
@@ -481,6 +700,8 @@ class ExtractionValidator:
         value_tokens = value_str.split()
         tokens_found = []
         tokens_not_found = []
+        # Tokens significatifs de l'OCR avec leurs ensembles de caractères
+        ocr_tokens = ocr_index["tokens"]
         
         for token in value_tokens:
             if len(token) > 3:  # Token significatif
@@ -490,14 +711,7 @@ class ExtractionValidator:
                 
                 if not token_in_ocr:
                     # Chercher le token le plus proche dans l'OCR
-                    ocr_tokens = ' '.join([span.get("text", "") for span in ocr_data.get("text", [])]).lower().split()
-                    for ocr_token in ocr_tokens:
-                        if len(ocr_token) > 3:  # Ignorer les tokens trop courts
-                            common = sum(1 for c in token if c in ocr_token)
-                            score = common / max(len(token), len(ocr_token))
-                            if score > 0.6 and score > match_score:  # Seuil de similarité
-                                match_score = score
-                                closest_match = ocr_token
+                    closest_match, match_score = best_token_match(token, ocr_tokens)
                 
                 if token_in_ocr:
                     tokens_found.append(token)
@@ -523,7 +737,7 @@ class ExtractionValidator:
                         field_name, value_str)
             
             # Vérifier les contraintes de format basiques
-            expected_format = self._get_expected_format(field_type)
+            expected_format = EXPECTED_FORMATS.get(field_type, '')
             
             if expected_format and not self._matches_expected_format(value_str, expected_format):
                 logger.error("Incorrect format for field %s: '%s' does not match expected format %s", 
@@ -560,7 +774,8 @@ class ExtractionValidator:
             if not (1 <= month <= 12):
                 logger.error("Invalid month value for %s: %d (should be 1-12)", field_name, month)
                 
-            current_year = datetime.now().year
+            now = self._now or datetime.now()
+            current_year = now.year
             if year < 1900 or year > current_year:
                 logger.warning("Unusual year value for %s: %d (outside range 1900-%d)", 
                              field_name, year, current_year)
@@ -571,7 +786,7 @@ class ExtractionValidator:
                 logger.info("Date %s is valid: %s", field_name, date_obj.strftime("%d/%m/%Y"))
                 
                 # Vérifier si c'est une date future
-                if date_obj > datetime.now():
+                if date_obj > now:
                     if "injury" in field_name.lower() or "receipt" in field_name.lower() or "filling" in field_name.lower():
                         logger.error("LOGIC ERROR: %s is a future date (%s) - this doesn't make sense for this field type", 
                                    field_name, date_obj.strftime("%d/%m/%Y"))
@@ -605,20 +820,7 @@ class ExtractionValidator:
         Returns:
             Type de champ inféré (numeric, text, date, phone, etc.)
         """
-        lower_name = field_name.lower()
-        
-        if any(term in lower_name for term in ['id', 'number', 'num', 'code']):
-            return 'numeric'
-        elif any(term in lower_name for term in ['phone', 'tel', 'mobile', 'landline']):
-            return 'phone'
-        elif any(term in lower_name for term in ['date', 'day', 'month', 'year']):
-            return 'date'
-        elif any(term in lower_name for term in ['name', 'first', 'last', 'family']):
-            return 'text'
-        elif any(term in lower_name for term in ['address', 'street', 'city']):
-            return 'address'
-        else:
-            return 'unknown'
+        return infer_field_type(field_name)
     
     def _get_expected_format(self, field_type: str) -> str:
         """
@@ -630,14 +832,7 @@ class ExtractionValidator:
         Returns:
             Description du format attendu
         """
-        formats = {
-            'numeric': 'sequence of digits',
-            'phone': 'phone number (digits only)',
-            'date': 'date (day/month/year)',
-            'text': 'text (not only digits)',
-            'address': 'address (street, number, city, etc.)'
-        }
-        return formats.get(field_type, '')
+        return EXPECTED_FORMATS.get(field_type, '')
     
     def _matches_expected_format(self, value: str, expected_format: str) -> bool:
         """
@@ -651,20 +846,10 @@ class ExtractionValidator:
         Returns:
             True si le format semble respecté, False sinon
         """
-        if 'digits only' in expected_format:
-            # Pour les téléphones, codes, etc. - devrait contenir principalement des chiffres
-            digits_ratio = sum(c.isdigit() for c in value) / len(value) if value else 0
-            return digits_ratio > 0.7  # Au moins 70% de chiffres
-            
-        elif 'sequence of digits' in expected_format:
-            # Pour les IDs, numéros, etc. - devrait être presque uniquement des chiffres
-            digits_ratio = sum(c.isdigit() for c in value) / len(value) if value else 0
-            return digits_ratio > 0.9  # Au moins 90% de chiffres
-            
-        elif 'not only digits' in expected_format:
-            # Pour les noms, etc. - ne devrait pas être que des chiffres
-            digits_ratio = sum(c.isdigit() for c in value) / len(value) if value else 0
-            return digits_ratio < 0.5  # Moins de 50% de chiffres
+        for marker, threshold, at_least in DIGIT_RATIO_RULES:
+            if marker in expected_format:
+                ratio = digit_ratio(value)
+                return ratio > threshold if at_least else ratio < threshold
             
         return True  # Format inconnu ou pas de contrainte particulière
     
@@ -679,67 +864,228 @@ class ExtractionValidator:
         Returns:
             dict: Dictionnaire aplati
         """
-        items = {}
-        for k, v in d.items():
-            new_key = f"{parent_key}.{k}" if parent_key else k
+        return dict(self._iter_flattened(d, parent_key))
+    
+    def _iter_flattened(self, d: Dict[str, Any], parent_key: str = "") -> Iterator[Tuple[str, Any]]:
+        """
+        Parcourt un dictionnaire imbriqué sans récursion ni dictionnaires intermédiaires.
+        Les champs sont produits dans le même ordre qu'un parcours récursif en profondeur.
+        
+        Args:
+            d: Dictionnaire à aplatir
+            parent_key: Préfixe pour les clés
             
-            if isinstance(v, dict):
-                items.update(self._flatten_dict(v, new_key))
+        Yields:
+            (clé aplatie "parent.enfant", valeur) pour chaque valeur non dictionnaire
+        """
+        stack = [(parent_key, iter(d.items()))]
+        while stack:
+            prefix, items = stack[-1]
+            for k, v in items:
+                new_key = f"{prefix}.{k}" if prefix else k
+                # Les données viennent de JSON : test de type exact, sans parcours du MRO
+                if type(v) is dict:
+                    # Descendre dans le sous-dictionnaire, puis reprendre ici
+                    stack.append((new_key, iter(v.items())))
+                    break
+                yield new_key, v
             else:
-                items[new_key] = v
-                
-        return items
+                stack.pop()
     
-    def _validate_spatial_coherence(self, bbox: Dict[str, float], all_elements: List[Dict[str, Any]]) -> float:
+    def _bboxes_to_array(self, elements: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Rassemble les boîtes englobantes d'une liste d'éléments dans un tableau NumPy.
+        
+        Les coins sont calculés une seule fois ici, de sorte que les calculs de chevauchement
+        travaillent directement sur des colonnes contiguës.
+        
+        Args:
+            elements: Éléments portant une clé "bounding_box" {x, y, width, height}
+            
+        Returns:
+            np.ndarray: Tableau (N, 4) de x1, y1, x2, y2 ; NaN pour les boîtes incomplètes
+        """
+        rows = [to_bbox(element.get("bounding_box")) or MISSING_BBOX for element in elements]
+        return np.array(rows, dtype=np.float64).reshape(-1, 4)
+    
+    def _validate_spatial_coherence(self, bbox: Dict[str, float], all_elements: List[Dict[str, Any]],
+                                    boxes: Optional[np.ndarray] = None) -> float:
         """
         Valide la cohérence spatiale d'un élément par rapport aux autres.
         
+        Les IoU avec tous les éléments sont calculés en une seule passe vectorisée. Les éléments
+        ayant exactement la même boîte que l'élément (dont lui-même) sont exclus de la moyenne ;
+        une boîte incomplète compte pour un chevauchement nul.
+        
         Args:
             bbox: Boîte englobante de l'élément {x, y, width, height}
             all_elements: Liste de tous les éléments à comparer
+            boxes: Coins de all_elements déjà calculés par _bboxes_to_array (calculés ici sinon)
             
         Returns:
             Score de cohérence spatiale entre 0 et 1
         """
         if not all_elements:
             return 1.0
-            
-        overlaps = []
-        for element in all_elements:
-            if element.get("bounding_box") == bbox:
-                continue
-                
-            overlap = self._calculate_overlap(bbox, element.get("bounding_box", {}))
-            overlaps.append(overlap)
-            
+        
+        # Sans boîte complète pour l'élément, tous les chevauchements sont nuls
+        query = to_bbox(bbox)
+        if query is None:
+            return 1.0
+        x1, y1, x2, y2 = query
+        
+        if boxes is None:
+            boxes = self._bboxes_to_array(all_elements)
+        boxes = boxes[~np.isnan(boxes[:, 0])]
+        
+        # Éléments identiques à l'élément (lui-même compris) : exclus de la moyenne
+        same = (boxes == query).all(axis=1)
+        n_compared = len(all_elements) - int(np.count_nonzero(same))
+        if n_compared == 0:
+            return 1.0
+        
+        bx1, by1, bx2, by2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        
+        # Intersection de l'élément avec toutes les boîtes
+        inter_w = np.minimum(bx2, x2) - np.maximum(bx1, x1)
+        inter_h = np.minimum(by2, y2) - np.maximum(by1, y1)
+        intersection = np.where((inter_w >= 0) & (inter_h >= 0), inter_w * inter_h, 0.0)
+        
+        # IoU (Intersection over Union), nul si l'union est vide
+        union = (x2 - x1) * (y2 - y1) + self._box_areas(boxes) - intersection
+        iou = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+        iou[same] = 0.0
+        
         # Retourner un score basé sur le chevauchement moyen
-        avg_overlap = np.mean(overlaps) if overlaps else 0.0
+        avg_overlap = float(iou.sum()) / n_compared
         return 1.0 - min(avg_overlap / self.spatial_overlap_threshold, 1.0)
     
-    def _calculate_overlap(self, bbox1: Dict[str, float], bbox2: Dict[str, float]) -> float:
+    def _box_areas(self, boxes: np.ndarray) -> np.ndarray:
+        """
+        Calcule l'aire de chaque boîte.
+        
+        Args:
+            boxes: Tableau (N, 4) de coins x1, y1, x2, y2
+            
+        Returns:
+            np.ndarray: Aires des N boîtes
+        """
+        return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    
+    def _compute_iou_matrix(self, boxes_a: np.ndarray, boxes_b: np.ndarray,
+                            areas_a: Optional[np.ndarray] = None,
+                            areas_b: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Calcule les IoU de toutes les paires de boîtes par diffusion (broadcasting).
+        
+        Args:
+            boxes_a: Tableau (N, 4) de coins x1, y1, x2, y2
+            boxes_b: Tableau (M, 4) de coins x1, y1, x2, y2
+            areas_a: Aires de boxes_a déjà calculées par _box_areas (calculées ici sinon)
+            areas_b: Aires de boxes_b déjà calculées par _box_areas (calculées ici sinon)
+            
+        Returns:
+            np.ndarray: Matrice (N, M) des IoU, nuls lorsque l'union est vide
+        """
+        # Côtés de l'intersection, calculés en place dans un seul tableau (N, M, 2) ; un côté
+        # négatif (pas de recouvrement) est ramené à 0, ce qui annule l'aire
+        sides = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+        sides -= np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+        np.maximum(sides, 0.0, out=sides)
+        intersection = sides[..., 0] * sides[..., 1]
+        
+        if areas_a is None:
+            areas_a = self._box_areas(boxes_a)
+        if areas_b is None:
+            areas_b = self._box_areas(boxes_b)
+        union = np.add.outer(areas_a, areas_b)
+        union -= intersection
+        return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+    
+    def _spatial_coherence_scores(self, boxes: np.ndarray, block_size: int = 128) -> np.ndarray:
+        """
+        Calcule le score de cohérence spatiale de chaque élément par rapport à tous les autres.
+        
+        Équivaut à appeler _validate_spatial_coherence pour chaque élément, mais à partir de la
+        matrice des IoU. Les boîtes sont triées verticalement et traitées par blocs : chaque bloc
+        n'est comparé qu'aux boîtes dont l'étendue verticale peut le recouvrir, les autres ayant
+        un IoU nul.
+        
+        Args:
+            boxes: Coins de tous les éléments, tels que renvoyés par _bboxes_to_array
+            block_size: Nombre de lignes de la matrice calculées à la fois
+            
+        Returns:
+            np.ndarray: Scores entre 0 et 1, dans l'ordre des éléments
+        """
+        n_elements = len(boxes)
+        scores = np.ones(n_elements, dtype=np.float64)
+        
+        # Sans boîte complète, un élément garde le score maximal et ne pèse sur aucun autre
+        valid_idx = np.flatnonzero(~np.isnan(boxes[:, 0]))
+        
+        # Tri par bord supérieur : les spans suivent l'ordre de lecture, si bien qu'un bloc de boîtes
+        # consécutives couvre une bande horizontale étroite de la page
+        order = valid_idx[np.argsort(boxes[valid_idx, 1], kind='stable')]
+        sorted_boxes = boxes[order]
+        sorted_y1 = sorted_boxes[:, 1]
+        # Plus grand bord inférieur parmi les boîtes précédentes (croissant, donc recherchable)
+        running_max_y2 = np.maximum.accumulate(sorted_boxes[:, 3]) if len(order) else sorted_boxes[:, 3]
+        # Aires calculées une seule fois, réutilisées par tous les blocs
+        sorted_areas = self._box_areas(sorted_boxes)
+        
+        # Nombre d'éléments ayant exactement la même boîte que chaque élément (lui-même compris),
+        # exclus de la moyenne : un seul tri au lieu d'une comparaison de toutes les paires
+        _, duplicate_idx, duplicate_counts = np.unique(sorted_boxes, axis=0, return_inverse=True,
+                                                       return_counts=True)
+        n_same = duplicate_counts[duplicate_idx.reshape(-1)]
+        # Une boîte identique a un IoU de 1 avec l'élément (0 si son aire est nulle)
+        same_overlap = np.where(sorted_areas > 0, n_same, 0)
+        
+        for start in range(0, len(order), block_size):
+            stop = start + block_size
+            block = sorted_boxes[start:stop]
+            
+            # Candidates : boîtes commençant avant le bas du bloc et finissant après son haut
+            lo = int(np.searchsorted(running_max_y2, block[:, 1].min(), side='left'))
+            hi = int(np.searchsorted(sorted_y1, block[:, 3].max(), side='right'))
+            candidates = sorted_boxes[lo:hi]
+            iou = self._compute_iou_matrix(block, candidates, sorted_areas[start:stop], sorted_areas[lo:hi])
+            
+            # Retirer la contribution des éléments identiques, qui se recouvrent forcément et font donc
+            # partie des candidates (bornée à 0 contre les erreurs d'arrondi de la soustraction)
+            overlap_sum = np.maximum(iou.sum(axis=1) - same_overlap[start:stop], 0.0)
+            n_compared = n_elements - n_same[start:stop]
+            
+            avg_overlap = np.divide(overlap_sum, n_compared,
+                                    out=np.zeros(len(block)), where=n_compared > 0)
+            block_scores = 1.0 - np.minimum(avg_overlap / self.spatial_overlap_threshold, 1.0)
+            scores[order[start:stop]] = np.where(n_compared > 0, block_scores, 1.0)
+        
+        return scores
+    
+    def _calculate_overlap(self, box1: BBox, box2: BBox) -> float:
         """
         Calcule le chevauchement entre deux boîtes englobantes.
         
+        Les boîtes sont des BBox (ou des lignes du tableau renvoyé par _bboxes_to_array) ; la
+        vérification des clés est faite une seule fois, par to_bbox.
+        
         Args:
-            bbox1: Première boîte englobante {x, y, width, height}
-            bbox2: Deuxième boîte englobante {x, y, width, height}
+            box1: Première boîte englobante (x1, y1, x2, y2)
+            box2: Deuxième boîte englobante (x1, y1, x2, y2)
             
         Returns:
             Ratio de chevauchement entre 0 et 1
         """
-        # Vérifier que les boîtes englobantes sont complètes
-        if not all(k in bbox1 for k in ['x', 'y', 'width', 'height']) or \
-           not all(k in bbox2 for k in ['x', 'y', 'width', 'height']):
-            return 0.0
-            
-        x1, y1, w1, h1 = bbox1['x'], bbox1['y'], bbox1['width'], bbox1['height']
-        x2, y2, w2, h2 = bbox2['x'], bbox2['y'], bbox2['width'], bbox2['height']
+        ax1, ay1, ax2, ay2 = box1
+        bx1, by1, bx2, by2 = box2
         
         # Calculer l'intersection
-        x_left = max(x1, x2)
-        y_top = max(y1, y2)
-        x_right = min(x1 + w1, x2 + w2)
-        y_bottom = min(y1 + h1, y2 + h2)
+        x_left = max(ax1, bx1)
+        y_top = max(ay1, by1)
+        x_right = min(ax2, bx2)
+        y_bottom = min(ay2, by2)
         
         if x_right < x_left or y_bottom < y_top:
             return 0.0
@@ -747,9 +1093,9 @@ class ExtractionValidator:
         intersection_area = (x_right - x_left) * (y_bottom - y_top)
         
         # Calculer l'union
-        bbox1_area = w1 * h1
-        bbox2_area = w2 * h2
-        union_area = bbox1_area + bbox2_area - intersection_area
+        box1_area = (ax2 - ax1) * (ay2 - ay1)
+        box2_area = (bx2 - bx1) * (by2 - by1)
+        union_area = box1_area + box2_area - intersection_area
         
         # Retourner le ratio IoU (Intersection over Union)
-        return intersection_area / union_area if union_area > 0 else 0.0 
+        return float(intersection_area / union_area) if union_area > 0 else 0.0
@@ -1,7 +1,5 @@
 import streamlit as st
-import json
-import tempfile
-import os
+import orjson
 import sys
 from utils.ocr import DocumentIntelligenceExtractor
 from utils.openai_extractor import OpenAIExtractor
@@ -43,29 +41,29 @@ if uploaded_file is not None:
     col1, col2 = st.columns(2)
     
     with st.spinner("Traitement en cours..."):
-        # Créer un fichier temporaire
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_path = tmp_file.name
-
         try:
-            # Étape 1: Extraction OCR
+            # Étape 1: Extraction OCR (le fichier téléchargé est envoyé depuis la mémoire,
+            # sans fichier temporaire)
             with st.status("Extraction OCR en cours...") as status:
-                ocr_result = doc_extractor.extract_text(tmp_path)
+                uploaded_file.seek(0)
+                ocr_result = doc_extractor.extract_text_bytes(uploaded_file)
                 status.update(label="OCR terminé ✅")
                 
+                # Texte brut des lignes OCR, pour l'affichage et pour l'envoi à OpenAI
+                extracted_text = "\n".join(span["text"] for span in ocr_result["text"])
+                
                 with col1:
                     st.subheader("Texte extrait")
                     st.text_area(
                         "Texte brut",
-                        value=ocr_result["text"],
+                        value=extracted_text,
                         height=400,
                         disabled=True
                     )
 
             # Étape 2: Extraction structurée
             with st.status("Analyse du contenu en cours...") as status:
-                structured_result = openai_extractor.extract_structured_data(ocr_result["text"])
+                structured_result = openai_extractor.extract_structured_data(extracted_text)
                 status.update(label="Analyse terminée ✅")
                 
                 with col2:
@@ -73,10 +71,9 @@ if uploaded_file is not None:
                     st.json(structured_result)
                     
                     # Bouton de téléchargement
-                    json_str = json.dumps(structured_result, ensure_ascii=False, indent=2)
                     st.download_button(
                         label="📥 Télécharger les résultats (JSON)",
-                        data=json_str.encode('utf-8'),
+                        data=orjson.dumps(structured_result, option=orjson.OPT_INDENT_2),
                         file_name="resultats_extraction.json",
                         mime="application/json"
                     )
@@ -85,10 +82,6 @@ if uploaded_file is not None:
 
         except Exception as e:
             st.error(f"Une erreur est survenue : {str(e)}")
-        
-        finally:
-            # Nettoyer le fichier temporaire
-            os.unlink(tmp_path)
 else:
     # Message d'attente
     st.info("👆 Téléchargez un formulaire pour commencer l'extraction.") 
\ No newline at end of file
@@ -1,11 +1,10 @@
 import streamlit as st
-import json
-import tempfile
+import orjson
 import os
 import sys
-from utils.ocr import DocumentIntelligenceExtractor
-from utils.openai_extractor import OpenAIExtractor
-from utils.validation import ExtractionValidator
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from utils.log_view import build_log_view, read_log_tail
 
 # Configuration de la page
 st.set_page_config(
@@ -25,12 +24,38 @@ This application automatically extracts information from National Insurance Inst
 3. View the extracted results
 """)
 
-# Initialisation des extracteurs
+# Initialisation des extracteurs. Les SDK Azure et OpenAI ne sont importés qu'ici, au premier
+# fichier téléchargé : la page s'affiche sans les attendre, et une erreur d'import ou de
+# configuration est affichée dans la page au lieu d'empêcher son affichage
 @st.cache_resource
 def get_extractors():
+    from utils.ocr import DocumentIntelligenceExtractor
+    from utils.openai_extractor import OpenAIExtractor
+    from utils.validation import ExtractionValidator
     return DocumentIntelligenceExtractor(), OpenAIExtractor(), ExtractionValidator()
 
-doc_extractor, openai_extractor, validator = get_extractors()
+# Un seul thread d'arrière-plan partagé par toutes les sessions, pour les tâches dont la page
+# n'attend pas le résultat (préchauffage des connexions)
+@st.cache_resource
+def get_background_executor():
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="warmup")
+
+# Cache des résultats OCR, indexé par l'empreinte SHA-256 du fichier (le fichier n'est pas haché une seconde fois)
+@st.cache_data(ttl="1h", max_entries=128, show_spinner=False)
+def cached_ocr(file_hash, _uploaded_file):
+    _uploaded_file.seek(0)
+    return doc_extractor.extract_text_bytes(_uploaded_file)
+
+# Cache de l'extraction structurée, indexé par (modèle, version du prompt, empreinte du texte)
+@st.cache_data(ttl="1h", max_entries=128, show_spinner=False)
+def cached_structured(model, prompt_version, text_hash, _text_content):
+    return openai_extractor.extract_structured_data(_text_content)
+
+# Vue du fichier de log mise en cache tant que le fichier n'a pas changé (mêmes date de modification
+# et taille) ; cache_resource car la vue n'est jamais modifiée et n'a pas besoin d'être copiée
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_log_view(path, mtime, size):
+    return build_log_view(read_log_tail(path, size))
 
 # Zone de téléchargement
 uploaded_file = st.file_uploader(
@@ -44,20 +69,27 @@ if uploaded_file is not None:
     col1, col2 = st.columns(2)
     
     with st.spinner("Processing..."):
-        # Créer un fichier temporaire
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_path = tmp_file.name
-
         try:
-            # Étape 1: Extraction OCR
+            doc_extractor, openai_extractor, validator = get_extractors()
+            from config import AZURE_OPENAI_DEPLOYMENT_NAME
+            
+            # Étape 1: Extraction OCR (le fichier est haché sur place et envoyé depuis la mémoire,
+            # sans fichier temporaire ni copie de son contenu)
             with st.status("OCR extraction in progress...") as status:
-                ocr_result = doc_extractor.extract_text(tmp_path)
+                with uploaded_file.getbuffer() as file_view:
+                    file_hash = hashlib.sha256(file_view).hexdigest()
+                
+                # L'extraction structurée dépend du texte OCR : seul le préchauffage de la connexion
+                # Azure OpenAI peut se faire pendant l'OCR
+                get_background_executor().submit(openai_extractor.warmup)
+                ocr_result = cached_ocr(file_hash, uploaded_file)
                 status.update(label="OCR completed ✅")
                 
+                # Texte extrait construit une seule fois, pour l'affichage et pour l'envoi à OpenAI
+                extracted_text = "\n".join([span.get("text", "") for span in ocr_result.get("text", [])])
+                
                 with col1:
                     st.subheader("Extracted Text")
-                    extracted_text = "\n".join([span.get("text", "") for span in ocr_result.get("text", [])])
                     st.text_area(
                         "Raw Text",
                         value=extracted_text,
@@ -67,8 +99,13 @@ if uploaded_file is not None:
 
             # Étape 2: Extraction structurée
             with st.status("Content analysis in progress...") as status:
-                text_content = "\n".join([span.get("text", "") for span in ocr_result.get("text", [])])
-                structured_result = openai_extractor.extract_structured_data(text_content)
+                text_hash = hashlib.sha256(extracted_text.encode("utf-8")).hexdigest()
+                structured_result = cached_structured(
+                    AZURE_OPENAI_DEPLOYMENT_NAME,
+                    openai_extractor.PROMPT_VERSION,
+                    text_hash,
+                    extracted_text
+                )
                 status.update(label="Analysis completed ✅")
                 
                 with col2:
@@ -76,10 +113,9 @@ if uploaded_file is not None:
                     st.json(structured_result)
                     
                     # Bouton de téléchargement
-                    json_str = json.dumps(structured_result, ensure_ascii=False, indent=2)
                     st.download_button(
                         label="📥 Download results (JSON)",
-                        data=json_str.encode('utf-8'),
+                        data=orjson.dumps(structured_result, option=orjson.OPT_INDENT_2),
                         file_name="extraction_results.json",
                         mime="application/json"
                     )
@@ -129,254 +165,68 @@ if uploaded_file is not None:
                     # Afficher le fichier de log de validation
                     log_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "extraction_validation.log")
                     if os.path.exists(log_file_path):
-                        with open(log_file_path, 'r') as log_file:
-                            log_content = log_file.readlines()
+                        log_stat = os.stat(log_file_path)
+                        view = load_log_view(log_file_path, log_stat.st_mtime, log_stat.st_size)
+                        
+                        # Créer des onglets pour différents types de logs
+                        log_tabs = st.tabs(["Summary", "Errors & Warnings", "Detailed Logs"])
+                        
+                        with log_tabs[0]:
+                            # Créer un tableau de métriques
+                            metrics_col1, metrics_col2 = st.columns(2)
                             
-                            # Créer des onglets pour différents types de logs
-                            log_tabs = st.tabs(["Summary", "Errors & Warnings", "Detailed Logs"])
+                            # Afficher les métriques sous forme de KPIs
+                            with metrics_col1:
+                                if view.completeness:
+                                    st.metric("Completeness", view.completeness)
+                                if view.ocr_confidence:
+                                    st.metric("OCR Confidence", view.ocr_confidence)
                             
-                            with log_tabs[0]:
-                                # Extraire les informations essentielles pour un résumé vraiment concis
-                                
-                                # Créer un tableau de métriques
-                                metrics_col1, metrics_col2 = st.columns(2)
-                                
-                                # Trouver les métriques clés
-                                completeness = None
-                                accuracy = None
-                                ocr_confidence = None
-                                for line in log_content:
-                                    if "COMPLETENESS:" in line:
-                                        completeness = line.split("COMPLETENESS:")[1].strip()
-                                    elif "ACCURACY:" in line:
-                                        accuracy = line.split("ACCURACY:")[1].strip()
-                                    elif "OCR CONFIDENCE:" in line:
-                                        ocr_confidence = line.split("OCR CONFIDENCE:")[1].strip()
-                                
-                                # Afficher les métriques sous forme de KPIs
-                                with metrics_col1:
-                                    if completeness:
-                                        st.metric("Completeness", completeness)
-                                    if ocr_confidence:
-                                        st.metric("OCR Confidence", ocr_confidence)
-                                
-                                with metrics_col2:
-                                    if accuracy:
-                                        st.metric("Accuracy", accuracy)
-                                
-                                # Vérification des champs manquants
-                                missing_fields = []
-                                for line in log_content:
-                                    if "Missing required fields" in line:
-                                        missing_fields.append(line)
-                                
-                                if missing_fields:
-                                    st.error("Missing required fields:\n" + "\n".join(missing_fields))
-                                # Suppression du message de succès concernant les champs requis
-                                
-                                # Extraire et afficher les problèmes importants
-                                important_issues = []
-                                
-                                # Trouver l'intervalle de la dernière session si ce n'est pas déjà fait
-                                if 'last_start_index' not in locals():
-                                    last_start_index = None
-                                    for i, line in enumerate(log_content):
-                                        if "VALIDATION STARTED" in line:
-                                            last_start_index = i
-                                
-                                if 'last_end_index' not in locals() and last_start_index is not None:
-                                    last_end_index = None
-                                    for i in range(last_start_index, len(log_content)):
-                                        if "VALIDATION FINISHED" in log_content[i]:
-                                            last_end_index = i
-                                            break
-                                    if last_end_index is None:
-                                        last_end_index = len(log_content) - 1
-                                
-                                # N'extraire que les problèmes de la dernière session
-                                if last_start_index is not None and last_end_index is not None:
-                                    for i in range(last_start_index, last_end_index + 1):
-                                        if "INVALID" in log_content[i] and "FORMAT" in log_content[i]:
-                                            important_issues.append(log_content[i])
-                                        elif "ERROR:" in log_content[i] and any(term in log_content[i] for term in ["LOGIC ERROR", "TYPE SUBSTITUTION", "FORMAT ERROR"]):
-                                            important_issues.append(log_content[i])
-                                else:
-                                    # Comportement de secours - fallback au comportement précédent
-                                    for line in log_content:
-                                        if "INVALID" in line and "FORMAT" in line:
-                                            important_issues.append(line)
-                                        elif "ERROR:" in line and any(term in line for term in ["LOGIC ERROR", "TYPE SUBSTITUTION", "FORMAT ERROR"]):
-                                            important_issues.append(line)
-                                
-                                if important_issues:
-                                    st.subheader("⚠️ Detected Issues")
-                                    st.code("\n".join(important_issues), language="bash")
-                                else:
-                                    st.success("✅ No major issues detected")
+                            with metrics_col2:
+                                if view.accuracy:
+                                    st.metric("Accuracy", view.accuracy)
                             
-                            with log_tabs[1]:
-                                # Filtrer uniquement les erreurs et avertissements de la dernière session
-                                error_logs = []
-                                
-                                # Utiliser les indices de session déjà déterminés ou les déterminer
-                                if 'last_start_index' not in locals():
-                                    last_start_index = None
-                                    for i, line in enumerate(log_content):
-                                        if "VALIDATION STARTED" in line:
-                                            last_start_index = i
-                                
-                                if 'last_end_index' not in locals() and last_start_index is not None:
-                                    last_end_index = None
-                                    for i in range(last_start_index, len(log_content)):
-                                        if "VALIDATION FINISHED" in log_content[i]:
-                                            last_end_index = i
-                                            break
-                                    if last_end_index is None:
-                                        last_end_index = len(log_content) - 1
-                                
-                                # N'extraire que les erreurs et avertissements de la dernière session
-                                if last_start_index is not None and last_end_index is not None:
-                                    for i in range(last_start_index, last_end_index + 1):
-                                        if " ERROR:" in log_content[i] or " WARNING:" in log_content[i]:
-                                            # Éviter les répétitions de messages similaires
-                                            if not any(existing_line.split(":", 3)[3] if len(existing_line.split(":", 3)) > 3 else "" == 
-                                                      log_content[i].split(":", 3)[3] if len(log_content[i].split(":", 3)) > 3 else "" 
-                                                      for existing_line in error_logs):
-                                                error_logs.append(log_content[i])
-                                else:
-                                    # Comportement de secours
-                                    for line in log_content:
-                                        if " ERROR:" in line or " WARNING:" in line:
-                                            # Éviter les répétitions de messages similaires
-                                            if not any(existing_line.split(":", 3)[3] if len(existing_line.split(":", 3)) > 3 else "" == 
-                                                      line.split(":", 3)[3] if len(line.split(":", 3)) > 3 else "" 
-                                                      for existing_line in error_logs):
-                                                error_logs.append(line)
-                                
-                                if error_logs:
-                                    st.code("".join(error_logs), language="bash")
-                                else:
-                                    st.success("No errors or warnings detected in the logs.")
+                            if view.missing_fields:
+                                st.error("Missing required fields:\n" + "\n".join(view.missing_fields))
+                            # Suppression du message de succès concernant les champs requis
                             
-                            with log_tabs[2]:
-                                # Afficher les logs complets organisés par catégories sans utiliser d'expanders dans des tabs
-                                sub_tabs = st.tabs(["General Information", "Field Validation", "Technical Logs", "All Logs"])
-                                
-                                # Logs généraux (démarrage, fin, résumé)
-                                general_logs = []
-                                
-                                # Utiliser les indices de session déjà déterminés ou les déterminer
-                                if 'last_start_index' not in locals():
-                                    last_start_index = None
-                                    for i, line in enumerate(log_content):
-                                        if "VALIDATION STARTED" in line:
-                                            last_start_index = i
-                                
-                                if 'last_end_index' not in locals() and last_start_index is not None:
-                                    last_end_index = None
-                                    for i in range(last_start_index, len(log_content)):
-                                        if "VALIDATION FINISHED" in log_content[i]:
-                                            last_end_index = i
-                                            break
-                                    if last_end_index is None:
-                                        last_end_index = len(log_content) - 1
-                                
-                                # N'extraire que les logs généraux de la dernière session
-                                if last_start_index is not None and last_end_index is not None:
-                                    for i in range(last_start_index, last_end_index + 1):
-                                        if any(term in log_content[i] for term in ["VALIDATION STARTED", "VALIDATION FINISHED", "SUMMARY", 
-                                                                                "COMPLETENESS:", "ACCURACY:", "OCR CONFIDENCE:"]):
-                                            general_logs.append(log_content[i])
+                            if view.issues:
+                                st.subheader("⚠️ Detected Issues")
+                                st.code("\n".join(view.issues), language="bash")
+                            else:
+                                st.success("✅ No major issues detected")
+                        
+                        with log_tabs[1]:
+                            if view.errors:
+                                st.code("".join(view.errors), language="bash")
+                            else:
+                                st.success("No errors or warnings detected in the logs.")
+                        
+                        with log_tabs[2]:
+                            # Afficher les logs complets organisés par catégories sans utiliser d'expanders dans des tabs
+                            sub_tabs = st.tabs(["General Information", "Field Validation", "Technical Logs", "All Logs"])
+                            
+                            # Afficher dans les sub_tabs
+                            with sub_tabs[0]:
+                                if view.general:
+                                    st.code("".join(view.general), language="bash")
                                 else:
-                                    # Comportement de secours
-                                    for line in log_content:
-                                        if any(term in line for term in ["VALIDATION STARTED", "VALIDATION FINISHED", "SUMMARY", 
-                                                                        "COMPLETENESS:", "ACCURACY:", "OCR CONFIDENCE:"]):
-                                            general_logs.append(line)
-                                
-                                # Logs de validation de champs
-                                validation_logs = []
-                                
-                                # Déterminer l'intervalle de la dernière session si ce n'est pas déjà fait
-                                if 'last_start_index' not in locals():
-                                    last_start_index = None
-                                    for i, line in enumerate(log_content):
-                                        if "VALIDATION STARTED" in line:
-                                            last_start_index = i
-                                
-                                if 'last_end_index' not in locals() and last_start_index is not None:
-                                    last_end_index = None
-                                    for i in range(last_start_index, len(log_content)):
-                                        if "VALIDATION FINISHED" in log_content[i]:
-                                            last_end_index = i
-                                            break
-                                    if last_end_index is None:
-                                        last_end_index = len(log_content) - 1
-                                
-                                # N'extraire que les logs de validation de la dernière session
-                                if last_start_index is not None and last_end_index is not None:
-                                    for i in range(last_start_index, last_end_index + 1):
-                                        if (("Checking field" in log_content[i]) or 
-                                            ("Format is valid" in log_content[i]) or 
-                                            ("Format is invalid" in log_content[i])):
-                                            validation_logs.append(log_content[i])
+                                    st.info("No general logs found.")
+                            
+                            with sub_tabs[1]:
+                                if view.validation:
+                                    st.code("".join(view.validation), language="bash")
                                 else:
-                                    # Comportement de secours
-                                    for line in log_content:
-                                        if (("Checking field" in line) or 
-                                            ("Format is valid" in line) or 
-                                            ("Format is invalid" in line)):
-                                            validation_logs.append(line)
-                                
-                                # Logs techniques
-                                debug_logs = []
-                                
-                                # Utiliser les indices de session déjà déterminés ou les déterminer
-                                if 'last_start_index' not in locals():
-                                    last_start_index = None
-                                    for i, line in enumerate(log_content):
-                                        if "VALIDATION STARTED" in line:
-                                            last_start_index = i
-                                
-                                if 'last_end_index' not in locals() and last_start_index is not None:
-                                    last_end_index = None
-                                    for i in range(last_start_index, len(log_content)):
-                                        if "VALIDATION FINISHED" in log_content[i]:
-                                            last_end_index = i
-                                            break
-                                    if last_end_index is None:
-                                        last_end_index = len(log_content) - 1
-                                
-                                # N'extraire que les logs techniques de la dernière session
-                                if last_start_index is not None and last_end_index is not None:
-                                    for i in range(last_start_index, last_end_index + 1):
-                                        if "DEBUG:" in log_content[i]:
-                                            debug_logs.append(log_content[i])
+                                    st.info("No validation logs found.")
+                            
+                            with sub_tabs[2]:
+                                if view.debug:
+                                    st.code("".join(view.debug), language="bash")
                                 else:
-                                    # Comportement de secours
-                                    debug_logs = [line for line in log_content if "DEBUG:" in line]
-                                
-                                # Afficher dans les sub_tabs
-                                with sub_tabs[0]:
-                                    if general_logs:
-                                        st.code("".join(general_logs), language="bash")
-                                    else:
-                                        st.info("No general logs found.")
-                                
-                                with sub_tabs[1]:
-                                    if validation_logs:
-                                        st.code("".join(validation_logs), language="bash")
-                                    else:
-                                        st.info("No validation logs found.")
-                                
-                                with sub_tabs[2]:
-                                    if debug_logs:
-                                        st.code("".join(debug_logs), language="bash")
-                                    else:
-                                        st.info("No technical logs found.")
-                                
-                                with sub_tabs[3]:
-                                    st.code("".join(log_content), language="bash")
+                                    st.info("No technical logs found.")
+                            
+                            with sub_tabs[3]:
+                                st.code("".join(view.lines), language="bash")
                     else:
                         st.warning("Log file not found")
 
@@ -384,10 +234,6 @@ if uploaded_file is not None:
 
         except Exception as e:
             st.error(f"An error occurred: {str(e)}")
-        
-        finally:
-            # Nettoyer le fichier temporaire
-            os.unlink(tmp_path)
 else:
     # Message d'attente
     st.info("👆 Upload a form to start extraction.")
@@ -0,0 +1,73 @@
+from app.utils import log_view
+from app.utils.log_view import build_log_view, read_log_tail
+
+
+def log_line(time, level, message):
+    return f"2025-04-17 18:{time} - extraction_validator - {level} - {message}\n"
+
+
+SESSION_1 = [
+    log_line("00:01", "INFO", "=== VALIDATION STARTED ==="),
+    log_line("00:02", "ERROR", "ERROR: old session error"),
+    log_line("00:03", "INFO", "COMPLETENESS: 50.00%"),
+    log_line("00:04", "INFO", "=== VALIDATION FINISHED ==="),
+]
+SESSION_2 = [
+    log_line("01:01", "INFO", "=== VALIDATION STARTED ==="),
+    log_line("01:02", "DEBUG", "DEBUG: Checking field idNumber"),
+    log_line("01:03", "WARNING", " WARNING: Missing required fields: idNumber"),
+    # Même message à un autre horodatage : affiché une seule fois
+    log_line("01:04", "WARNING", " WARNING: Missing required fields: idNumber"),
+    log_line("01:05", "ERROR", " ERROR: FORMAT ERROR on mobilePhone"),
+    log_line("01:06", "INFO", "COMPLETENESS: 80.00%"),
+    log_line("01:07", "INFO", "ACCURACY: 90.00%"),
+    log_line("01:08", "INFO", "=== VALIDATION FINISHED ==="),
+]
+
+
+def test_build_log_view_keeps_last_session():
+    view = build_log_view(SESSION_1 + SESSION_2)
+    
+    # Métriques : dernière valeur de tout le fichier
+    assert view.completeness == "80.00%"
+    assert view.accuracy == "90.00%"
+    assert view.ocr_confidence is None
+    # Champs manquants : tout le fichier ; autres catégories : dernière session seulement
+    assert len(view.missing_fields) == 2
+    assert view.general[0] == SESSION_2[0] and view.general[-1] == SESSION_2[-1]
+    assert view.validation == [SESSION_2[1]]
+    assert view.debug == [SESSION_2[1]]
+    assert view.issues == [SESSION_2[4]]
+
+
+def test_build_log_view_deduplicates_error_messages():
+    view = build_log_view(SESSION_2)
+    assert view.errors == [SESSION_2[2], SESSION_2[4]]
+
+
+def test_build_log_view_compares_lines_without_message_part():
+    # Sans partie message après l'horodatage, la ligne entière sert de clé
+    lines = [" ERROR: a\n", " ERROR: b\n", " ERROR: a\n"]
+    assert build_log_view(lines).errors == [" ERROR: a\n", " ERROR: b\n"]
+
+
+def test_read_log_tail_widens_window_to_last_session(tmp_path, monkeypatch):
+    path = tmp_path / "extraction_validation.log"
+    filler = [log_line("00:00", "DEBUG", "DEBUG: filler %d" % i) for i in range(200)]
+    path.write_text("".join(SESSION_1 + SESSION_2 + filler), encoding="utf-8")
+    size = path.stat().st_size
+    
+    # Fenêtre initiale bien plus petite que la dernière session et le bruit qui la suit
+    monkeypatch.setattr(log_view, "LOG_TAIL_BYTES", 64)
+    lines = read_log_tail(str(path), size)
+    
+    # La ligne tronquée au début de la fenêtre est écartée, la dernière session est incluse
+    assert lines[-len(filler):] == filler
+    assert SESSION_2[0] in lines
+    assert "".join(lines) == path.read_text(encoding="utf-8")[-len("".join(lines)):]
+
+
+def test_read_log_tail_small_file(tmp_path):
+    path = tmp_path / "extraction_validation.log"
+    path.write_text("".join(SESSION_1), encoding="utf-8")
+    assert read_log_tail(str(path), path.stat().st_size) == SESSION_1
@@ -1,6 +1,8 @@
 import pytest
-from app.utils.ocr import DocumentIntelligenceExtractor
+from app.utils.ocr import BackoffPolling, DocumentIntelligenceExtractor
 import os
+import random
+from types import SimpleNamespace
 
 @pytest.fixture
 def document_extractor():
@@ -25,4 +27,73 @@ def test_extract_text(document_extractor):
     assert len(result["text"]) > 0
     
     # Vérifier que la mise en page contient au moins une page
-    assert len(result["layout"]) > 0 
\ No newline at end of file
+    assert len(result["layout"]) > 0 
+
+@pytest.fixture
+def offline_extractor(monkeypatch):
+    # Extracteur sans client réseau, pour tester le post-traitement seul
+    monkeypatch.setenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT", "https://example.invalid")
+    monkeypatch.setenv("AZURE_DOCUMENT_INTELLIGENCE_KEY", "key")
+    monkeypatch.setattr(DocumentIntelligenceExtractor, "_get_client", classmethod(lambda cls, endpoint, key: None))
+    return DocumentIntelligenceExtractor()
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+@pytest.mark.parametrize("polygon", [
+    [[0, 0], [4, 0], [4, 3]],
+    [Point(0, 0), Point(4, 0), Point(4, 3)],
+    [[0, 0], [4, 0], [4, 3], [0, 3]],
+    [Point(0, 0), Point(4, 0), Point(4, 3), Point(0, 3)],
+])
+def test_bounding_box_after_flat_polygons(offline_extractor, polygon):
+    # Le format plat est mémorisé en premier : un autre format doit être reconnu à nouveau,
+    # même avec un nombre impair de sommets
+    assert offline_extractor._extract_bounding_box([0, 0, 1, 0, 1, 1, 0, 1]) == {"x": 0, "y": 0, "width": 1, "height": 1}
+    assert offline_extractor._extract_bounding_box(polygon) == {"x": 0, "y": 0, "width": 4, "height": 3}
+
+def test_odd_flat_polygon_gets_default_box(offline_extractor):
+    assert offline_extractor._extract_bounding_box([0, 0, 4, 0, 4]) == {"x": 0, "y": 0, "width": 100, "height": 20}
+
+@pytest.mark.parametrize("seed", range(10))
+def test_batch_bounding_boxes_match_scalar_path(offline_extractor, seed):
+    rng = random.Random(seed)
+    n_points = rng.choice([2, 4, 5])
+    flat = [[rng.uniform(0, 500) for _ in range(2 * n_points)] for _ in range(rng.randint(1, 40))]
+    pairs = [[[polygon[i], polygon[i + 1]] for i in range(0, len(polygon), 2)] for polygon in flat]
+    # Formats mélangés : repli sur le calcul polygone par polygone
+    mixed = flat + [[Point(0, 0), Point(3, 4)]]
+    
+    for polygons in (flat, pairs, mixed):
+        expected = [offline_extractor._extract_bounding_box(polygon) for polygon in polygons]
+        batch = offline_extractor._extract_bounding_boxes(polygons)
+        assert len(batch) == len(expected)
+        for box, expected_box in zip(batch, expected):
+            assert box == pytest.approx(expected_box)
+
+def backoff_polling(headers=None):
+    polling = BackoffPolling(initial_delay=0.25, max_delay=2.0, factor=2.0)
+    polling._pipeline_response = SimpleNamespace(http_response=SimpleNamespace(headers=headers or {}))
+    return polling
+
+def test_backoff_polling_delays_grow_until_capped():
+    polling = backoff_polling()
+    assert [polling._extract_delay() for _ in range(6)] == [0.25, 0.5, 1.0, 2.0, 2.0, 2.0]
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"Retry-After": "5"}, 5.0),
+    ({"retry-after-ms": "3000"}, 3.0),
+    ({"x-ms-retry-after-ms": "1500"}, 1.5),
+    # Une attente demandée plus courte que le backoff ne le raccourcit pas
+    ({"Retry-After": "0.1"}, 0.25),
+    ({"Retry-After": "not a delay"}, 0.25),
+])
+def test_retry_after_takes_precedence_over_backoff(headers, expected):
+    assert backoff_polling(headers)._extract_delay() == pytest.approx(expected)
+
+def test_retry_after_http_date():
+    polling = backoff_polling({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+    # Date passée : le backoff s'applique
+    assert polling._extract_delay() == 0.25
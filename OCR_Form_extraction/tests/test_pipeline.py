@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from app.utils.pipeline import extract_documents
+
+
+class FakeOCRExtractor:
+    """Renvoie les documents dans le désordre, comme des analyses concurrentes."""
+
+    def __init__(self, n_documents):
+        self.n_documents = n_documents
+        self.produced = 0
+        self.closed = False
+
+    async def iter_texts_async(self, file_paths, max_concurrent=3):
+        try:
+            for index in reversed(range(len(file_paths))):
+                await asyncio.sleep(0)
+                self.produced += 1
+                yield index, {"text": [{"text": f"line {index}"}]}
+        finally:
+            self.closed = True
+
+
+class FakeOpenAIExtractor:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.texts = []
+
+    async def extract_structured_data_async(self, text_content):
+        await asyncio.sleep(0)
+        if text_content == self.fail_on:
+            raise RuntimeError("LLM failure")
+        self.texts.append(text_content)
+        return {"text": text_content}
+
+
+@pytest.mark.parametrize("llm_workers, queue_size", [(1, 1), (2, 1), (3, 8)])
+def test_extract_documents_drains_queue_in_order(llm_workers, queue_size):
+    paths = [f"doc{i}.pdf" for i in range(10)]
+    ocr_extractor = FakeOCRExtractor(len(paths))
+    openai_extractor = FakeOpenAIExtractor()
+    
+    results = asyncio.run(extract_documents(paths, ocr_extractor, openai_extractor,
+                                            llm_workers=llm_workers, queue_size=queue_size))
+    
+    # Chaque document est extrait une seule fois et les résultats suivent l'ordre des fichiers
+    assert [result["structured"]["text"] for result in results] == [f"line {i}" for i in range(10)]
+    assert sorted(openai_extractor.texts) == sorted(f"line {i}" for i in range(10))
+
+
+def test_extract_documents_cancels_other_stages_on_error():
+    paths = [f"doc{i}.pdf" for i in range(50)]
+    ocr_extractor = FakeOCRExtractor(len(paths))
+    # Premier document servi (le dernier de la liste) en échec
+    openai_extractor = FakeOpenAIExtractor(fail_on="line 49")
+    
+    async def run():
+        with pytest.raises(RuntimeError, match="LLM failure"):
+            await extract_documents(paths, ocr_extractor, openai_extractor, llm_workers=1, queue_size=1)
+        # Laisser les tâches annulées se terminer
+        await asyncio.sleep(0.01)
+        
+        # Le producteur bloqué sur la file pleine est annulé (avant la fin de la boucle d'événements)
+        # au lieu de rester en attente ou d'analyser tous les documents
+        assert ocr_extractor.closed
+        assert ocr_extractor.produced < len(paths)
+    
+    asyncio.run(run())
@@ -0,0 +1,76 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.utils.validation import ExtractionValidator
+
+
+def reference_spatial_score(validator, bbox, all_elements):
+    # Boucle par span d'origine (une paire de boîtes à la fois), référence du calcul vectorisé
+    overlaps = []
+    for element in all_elements:
+        other = element.get("bounding_box", {})
+        if other == bbox:
+            continue
+        if not all(k in bbox for k in ['x', 'y', 'width', 'height']) or \
+           not all(k in other for k in ['x', 'y', 'width', 'height']):
+            overlaps.append(0.0)
+            continue
+        x_left = max(bbox['x'], other['x'])
+        y_top = max(bbox['y'], other['y'])
+        x_right = min(bbox['x'] + bbox['width'], other['x'] + other['width'])
+        y_bottom = min(bbox['y'] + bbox['height'], other['y'] + other['height'])
+        if x_right < x_left or y_bottom < y_top:
+            overlaps.append(0.0)
+            continue
+        intersection = (x_right - x_left) * (y_bottom - y_top)
+        union = bbox['width'] * bbox['height'] + other['width'] * other['height'] - intersection
+        overlaps.append(intersection / union if union > 0 else 0.0)
+    avg_overlap = np.mean(overlaps) if overlaps else 0.0
+    return 1.0 - min(avg_overlap / validator.spatial_overlap_threshold, 1.0)
+
+
+def random_spans(rng, n_spans):
+    spans = []
+    for i in range(n_spans):
+        if rng.random() < 0.05:
+            # Span sans boîte englobante
+            spans.append({"text": f"span {i}"})
+            continue
+        spans.append({"text": f"span {i}", "bounding_box": {
+            "x": rng.uniform(0, 100),
+            "y": i * 2 + rng.uniform(-5, 5),
+            "width": rng.choice([0, rng.uniform(0, 30)]),
+            "height": rng.uniform(0, 6)
+        }})
+    # Boîtes en double (mêmes coordonnées), exclues les unes des autres par la référence
+    spans += [dict(span) for span in rng.sample(spans, min(5, len(spans)))]
+    return spans
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("block_size", [1, 7, 128])
+def test_spatial_coherence_scores_match_per_span_loop(seed, block_size):
+    validator = ExtractionValidator()
+    rng = random.Random(seed)
+    spans = random_spans(rng, rng.randint(1, 300))
+    
+    expected = [reference_spatial_score(validator, span.get("bounding_box", {}), spans) for span in spans]
+    scores = validator._spatial_coherence_scores(validator._bboxes_to_array(spans), block_size=block_size)
+    
+    np.testing.assert_allclose(scores, expected, atol=1e-9)
+
+
+def test_spatial_coherence_scores_integer_grid():
+    # Petites coordonnées entières : beaucoup de boîtes identiques ou de surface nulle
+    validator = ExtractionValidator()
+    rng = random.Random(0)
+    for _ in range(200):
+        spans = [{"bounding_box": {"x": rng.randint(0, 10), "y": rng.randint(0, 10),
+                                   "width": rng.randint(0, 5), "height": rng.randint(0, 5)}}
+                 for _ in range(rng.randint(1, 12))]
+        expected = [reference_spatial_score(validator, span["bounding_box"], spans) for span in spans]
+        scores = validator._spatial_coherence_scores(validator._bboxes_to_array(spans),
+                                                     block_size=rng.randint(1, 5))
+        np.testing.assert_allclose(scores, expected, atol=1e-9)
@@ -0,0 +1,47 @@
+import logging
+
+import pytest
+
+from app.utils import validation
+from app.utils.validation import ExtractionValidator
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def collected(monkeypatch):
+    # Remplacer le fichier de log par une liste, le temps du test
+    handler = CollectingHandler()
+    validation.memory_handler.flush()
+    monkeypatch.setattr(validation.memory_handler, "target", handler)
+    yield handler
+    validation.memory_handler.flush()
+
+
+def test_validation_logs_are_buffered_then_written_once(collected):
+    validation.logger.debug("buffered record")
+    # Un enregistrement sous le niveau ERROR reste en mémoire
+    assert collected.messages == []
+    
+    ExtractionValidator().validate_extraction({"text": [
+        {"text": "abc", "confidence": 0.9, "bounding_box": {"x": 0, "y": 0, "width": 10, "height": 5}},
+        {"text": "def", "confidence": 0.2, "bounding_box": {"x": 2, "y": 1, "width": 10, "height": 5}},
+    ]})
+    
+    # Tout est écrit à la fin de la validation, dans l'ordre
+    assert collected.messages[0] == "buffered record"
+    assert any(message.startswith("OCR validation completed") for message in collected.messages)
+    assert validation.memory_handler.buffer == []
+
+
+def test_error_records_are_written_immediately(collected):
+    validation.logger.debug("before the error")
+    validation.logger.error("validation error")
+    assert collected.messages == ["before the error", "validation error"]